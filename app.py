@@ -1,42 +1,72 @@
 import logging
 import platform
 import locale
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, request, render_template, jsonify, url_for, Response, send_file
 from pathlib import Path
 import json
-import os.path
-from scripts.archive_struct import get_directory_structure
-from scripts.sheet_writer import write_hierarchy_to_sheet
-from scripts.analysis_utils import count_pdf_pages, get_page_size
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from natsort import natsorted, ns
-from datetime import datetime
+import os
+import uuid
+from scripts.archive_struct import DEFAULT_ARCHIVE_BYTE_BUDGET
+from scripts.analysis_cache import AnalysisCache
+from scripts.analysis_executor import AnalysisExecutor
+from scripts.export import EXPORT_FORMATS, EXPORT_MIMETYPES, prune_exports
+from scripts.inventory import run_inventory
+from scripts.jobs import JobManager, JobQueueFull, FINISHED_STATES
+from scripts.log_config import setup_logging
+from scripts.metrics import REGISTRY
+
+# Настройка логирования: запись в файл и консоль идёт в отдельном потоке, уровень — LOG_LEVEL
+LOG_DIR = Path('logs')
+LOG_FILE = LOG_DIR / 'app.log'
+setup_logging(LOG_FILE)
+logger = logging.getLogger(__name__)
 
 # Устанавливаем локаль для корректной сортировки кириллицы
 try:
     locale.setlocale(locale.LC_ALL, 'ru_RU.UTF-8')
 except locale.Error:
-    logging.warning("Локаль ru_RU.UTF-8 не поддерживается, используется стандартная локаль")
-
-# Настройка логирования
-LOG_DIR = Path('logs')
-LOG_FILE = LOG_DIR / 'app.log'
-LOG_DIR.mkdir(exist_ok=True)
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+    logger.warning("Локаль ru_RU.UTF-8 не поддерживается, используется стандартная локаль")
 
 app = Flask(__name__)
 OUTPUT_FOLDER = Path('output')
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 OUTPUT_FOLDER.mkdir(exist_ok=True)
+# Локальные выгрузки иерархии (NDJSON/CSV/XLSX) для скачивания; хранятся последние EXPORT_KEEP_FILES
+EXPORT_FOLDER = OUTPUT_FOLDER / 'exports'
+EXPORT_FOLDER.mkdir(exist_ok=True)
+app.config['EXPORT_KEEP_FILES'] = int(os.environ.get('EXPORT_KEEP_FILES', 100))
+app.config['ANALYSIS_CACHE_MAX_ENTRIES'] = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 200000))
+
+# Исполнитель анализа: thread / process / serial
+app.config['ANALYSIS_EXECUTOR'] = os.environ.get('ANALYSIS_EXECUTOR', 'thread')
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', 0)) or None
+app.config['ANALYSIS_BATCH_SIZE'] = int(os.environ.get('ANALYSIS_BATCH_SIZE', 0))
+app.config['ANALYSIS_FILE_TIMEOUT'] = float(os.environ.get('ANALYSIS_FILE_TIMEOUT', 120)) or None
+
+# Инвентаризация содержимого архивов и лимит чтения распакованных байт на архив
+app.config['ARCHIVE_EXPANSION'] = os.environ.get('ARCHIVE_EXPANSION', '1') not in ('0', 'false', 'no')
+app.config['ARCHIVE_BYTE_BUDGET'] = int(os.environ.get('ARCHIVE_BYTE_BUDGET', DEFAULT_ARCHIVE_BYTE_BUDGET))
+
+# Обход папки: SCAN_WORKERS > 1 — параллельное чтение каталогов (сетевые диски SMB/NFS, /mnt/<диск> в WSL),
+# не более SCAN_MAX_IN_FLIGHT чтений одновременно; 0 в ограничениях — без ограничения
+app.config['SCAN_WORKERS'] = int(os.environ.get('SCAN_WORKERS', 1))
+app.config['SCAN_MAX_IN_FLIGHT'] = int(os.environ.get('SCAN_MAX_IN_FLIGHT', 0)) or None
+app.config['SCAN_MAX_DEPTH'] = int(os.environ.get('SCAN_MAX_DEPTH', 0)) or None
+app.config['SCAN_MAX_ENTRIES'] = int(os.environ.get('SCAN_MAX_ENTRIES', 0)) or None
+
+# Фоновые задания: одновременно выполняются MAX_RUNNING_JOBS, ещё MAX_QUEUED_JOBS ждут в очереди
+app.config['MAX_RUNNING_JOBS'] = int(os.environ.get('MAX_RUNNING_JOBS', 2))
+app.config['MAX_QUEUED_JOBS'] = int(os.environ.get('MAX_QUEUED_JOBS', 10))
+SSE_KEEPALIVE_SECONDS = 15
+
+analysis_cache = AnalysisCache(OUTPUT_FOLDER / 'analysis_cache.sqlite', max_entries=app.config['ANALYSIS_CACHE_MAX_ENTRIES'])
+job_manager = JobManager(max_running=app.config['MAX_RUNNING_JOBS'], max_queued=app.config['MAX_QUEUED_JOBS'])
+analysis_executor = AnalysisExecutor(
+    mode=app.config['ANALYSIS_EXECUTOR'],
+    workers=app.config['ANALYSIS_WORKERS'],
+    batch_size=app.config['ANALYSIS_BATCH_SIZE'],
+    file_timeout=app.config['ANALYSIS_FILE_TIMEOUT']
+)
 
 def convert_path_to_current_platform(windows_path):
     """
@@ -68,6 +98,8 @@ def process_directory():
     if request.method == 'POST':
         server_path = request.form.get('server_path', '').strip()
         table_input = request.form.get('table_input', '').strip()
+        sync_worksheet = request.form.get('sync_worksheet', '').strip() or None
+        export_format = request.form.get('export_format', '').strip().lower() or None
 
         if not server_path:
             return jsonify({"error": "Не указан путь к папке"}), 400
@@ -76,91 +108,123 @@ def process_directory():
         server_path_obj = Path(server_path)
         if not server_path_obj.exists() or not server_path_obj.is_dir():
             return jsonify({"error": f"Указанная папка не существует или не является директорией: {server_path}"}), 400
+        if export_format and export_format not in EXPORT_FORMATS:
+            return jsonify({"error": f"Неизвестный формат выгрузки: {export_format}"}), 400
+
+        export_path = None
+        if export_format:
+            prune_exports(EXPORT_FOLDER, app.config['EXPORT_KEEP_FILES'])
+            export_path = EXPORT_FOLDER / f"{uuid.uuid4().hex}.{export_format}"
 
         try:
-            # Получаем структуру папки
-            structure = get_directory_structure(server_path)
-            if structure and isinstance(structure, list) and "error" in structure[0]:
-                return jsonify({"error": structure[0]["error"]}), 400
-
-            # Разделяем папки и файлы
-            folders = natsorted([item for item in structure if isinstance(item, dict)], key=lambda x: list(x.keys())[0], alg=ns.LOCALE)
-            files = natsorted([item for item in structure if isinstance(item, str)], alg=ns.LOCALE)
-
-            logger.info(f"Отсортированные файлы: {files}")
-
-            # Собираем список файлов для анализа (PDF, DOCX, XLSX)
-            files_to_analyze = []
-            for root, dirs, files_walk in server_path_obj.walk():
-                dirs[:] = natsorted(dirs, alg=ns.LOCALE)
-                files_walk[:] = natsorted(files_walk, alg=ns.LOCALE)
-                for file in files_walk:
-                    if file.lower().endswith(('.pdf', '.docx', '.xlsx')):
-                        files_to_analyze.append(root / file)
-
-            pdf_analysis_data = {}
-            if files_to_analyze:
-                max_workers = min(8, len(files_to_analyze))
-                with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                    future_to_file = {executor.submit(count_pdf_pages, file_path): file_path for file_path in files_to_analyze}
-                    for future in as_completed(future_to_file):
-                        file_path, pages = future.result()
-                        relative_path = os.path.normpath(str(file_path.relative_to(server_path_obj))).replace('\\', '/')
-                        if relative_path.startswith('6. НВК/'):
-                            relative_path = relative_path[len('6. НВК/'):]
-                        size_str = get_page_size(file_path) if file_path.suffix.lower() == '.pdf' else ""
-                        pdf_analysis_data[relative_path] = {
-                            "pages": pages,
-                            "size": size_str
-                        }
-                        logger.info(f"Добавлен файл: {relative_path} с {pages} страницами")
-
-            # Добавляем файлы без анализа
-            for root, dirs, files_walk in server_path_obj.walk():
-                for file in files_walk:
-                    if not file.lower().endswith(('.pdf', '.docx', '.xlsx')):
-                        relative_path = os.path.normpath(str((root / file).relative_to(server_path_obj))).replace('\\', '/')
-                        if relative_path.startswith('6. НВК/'):
-                            relative_path = relative_path[len('6. НВК/'):]
-                        pdf_analysis_data[relative_path] = {
-                            "pages": "",
-                            "size": ""
-                        }
-                        logger.info(f"Добавлен файл без анализа: {relative_path}")
-
-            pdf_analysis_data = dict(natsorted(pdf_analysis_data.items(), key=lambda x: x[0], alg=ns.LOCALE))
-            logger.info(f"Итоговый pdf_analysis_data: {list(pdf_analysis_data.keys())}")
-
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            json_path = app.config['OUTPUT_FOLDER'] / f'inventory_structure_{timestamp}.json'
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "root_folder": server_path_obj.name,
-                    "folders": folders,
-                    "files": files,
-                    "pdf_analysis_data": pdf_analysis_data
-                }, f, indent=4, ensure_ascii=False)
-
-            hierarchy_result = {"message": "Иерархия обработана", "json_path": str(json_path)}
-            if table_input:
-                try:
-                    message, summary = write_hierarchy_to_sheet(json_path, table_input)
-                    json_path.unlink(missing_ok=True)
-                    return jsonify({"hierarchy": hierarchy_result, "message": message, "summary": summary})
-                except Exception as e:
-                    json_path.unlink(missing_ok=True)
-                    logger.error(f"Ошибка записи в Google Sheets: {str(e)}")
-                    return jsonify({"hierarchy": hierarchy_result, "error": str(e)}), 400
-
-            json_path.unlink(missing_ok=True)
-            return jsonify({"hierarchy": hierarchy_result})
-
-        except Exception as e:
-            logger.error(f"Ошибка обработки папки {server_path}: {e}")
-            return jsonify({"error": str(e)}), 400
+            job = job_manager.submit(
+                run_inventory, server_path_obj, table_input,
+                analysis_cache=analysis_cache,
+                analysis_executor=analysis_executor,
+                archive_expansion=app.config['ARCHIVE_EXPANSION'],
+                archive_byte_budget=app.config['ARCHIVE_BYTE_BUDGET'],
+                sync_worksheet=sync_worksheet,
+                export_format=export_format,
+                export_path=export_path,
+                scan_options={
+                    "workers": app.config['SCAN_WORKERS'],
+                    "max_in_flight": app.config['SCAN_MAX_IN_FLIGHT'],
+                    "max_depth": app.config['SCAN_MAX_DEPTH'],
+                    "max_entries": app.config['SCAN_MAX_ENTRIES'],
+                },
+                description=server_path
+            )
+        except JobQueueFull as e:
+            return jsonify({"error": str(e)}), 429
+
+        response = {
+            "job_id": job.id,
+            "status_url": url_for('job_status', job_id=job.id),
+            "events_url": url_for('job_events', job_id=job.id),
+            "cancel_url": url_for('cancel_job', job_id=job.id)
+        }
+        if export_format:
+            response["export_url"] = url_for('download_export', job_id=job.id)
+        return jsonify(response), 202
 
     return render_template('input_path.html')
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Текущее состояние задания."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Задание не найдено"}), 404
+    return jsonify(job.snapshot())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Поток прогресса задания (server-sent events) до его завершения."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Задание не найдено"}), 404
+
+    def stream():
+        version = None
+        while True:
+            snapshot, new_version = job.wait_for_change(version, timeout=SSE_KEEPALIVE_SECONDS)
+            if new_version == version:
+                # Комментарий SSE не даёт прокси закрыть простаивающее соединение
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            if snapshot["state"] in FINISHED_STATES:
+                return
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Запрашивает отмену задания; оно остановится на ближайшей проверке."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Задание не найдено"}), 404
+    job.cancel()
+    return jsonify(job.snapshot())
+
+@app.route('/jobs/<job_id>/export', methods=['GET'])
+def download_export(job_id):
+    """Скачивание локальной выгрузки иерархии завершённого задания."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Задание не найдено"}), 404
+    export = ((job.result or {}).get("hierarchy") or {}).get("export")
+    if export is None:
+        return jsonify({"error": "Выгрузка для задания отсутствует или ещё не готова"}), 404
+    export_path = EXPORT_FOLDER / export["file"]
+    if not export_path.exists():
+        return jsonify({"error": "Файл выгрузки удалён"}), 404
+    download_name = f"Иерархия_{Path(job.description).name or 'папки'}.{export['format']}"
+    return send_file(export_path.resolve(), mimetype=EXPORT_MIMETYPES[export['format']],
+                     as_attachment=True, download_name=download_name)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Метрики процесса в текстовом формате Prometheus: стадии инвентаризаций и очередь заданий."""
+    job_counts = job_manager.counts()
+    gauges = {
+        "inventory_jobs": ("Задания по состоянию", [({"state": state}, count) for state, count in sorted(job_counts.items())]),
+        "analysis_workers": ("Исполнителей анализа", [({"mode": analysis_executor.mode}, analysis_executor.workers)]),
+    }
+    return Response(REGISTRY.render(gauges), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/cache/invalidate', methods=['POST'])
+def invalidate_analysis_cache():
+    """Сбрасывает кэш анализа для одной корневой папки."""
+    server_path = request.form.get('server_path', '').strip()
+    if not server_path:
+        return jsonify({"error": "Не указан путь к папке"}), 400
+    cache_root = str(Path(convert_path_to_current_platform(server_path)).resolve())
+    removed = analysis_cache.invalidate_root(cache_root)
+    return jsonify({"message": f"Кэш анализа очищен для {cache_root}", "removed": removed})
+
 if __name__ == '__main__':
     logger.info(f"Запуск приложения на платформе: {platform.system()}")
     try:
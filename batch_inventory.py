@@ -0,0 +1,221 @@
+"""
+Пакетная инвентаризация многих папок в одном процессе (без веб-интерфейса).
+
+Папки задаются путями или шаблонами glob (и/или файлом со списком, по одной на строку).
+Все папки обрабатываются одним пулом анализа и одним кэшем анализа; сканирование
+следующей папки идёт параллельно с анализом текущей. Для каждой папки пишется
+выгрузка в output-dir, в конце печатается суммарная скорость и сохраняется summary.json.
+
+Пример:
+    python batch_inventory.py "/mnt/d/Orders/*" --output-dir output/batch --format csv
+"""
+import argparse
+import glob
+import json
+import locale
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+from scripts.analysis_cache import AnalysisCache
+from scripts.analysis_executor import AnalysisExecutor, EXECUTOR_MODES
+from scripts.archive_struct import DEFAULT_ARCHIVE_BYTE_BUDGET
+from scripts.collation import Collator
+from scripts.export import EXPORT_FORMATS, export_hierarchy
+from scripts.inventory import analyze_root, scan_root
+from scripts.log_config import setup_logging
+from scripts.metrics import RunMetrics
+from scripts.tree_model import FOLDER
+
+logger = logging.getLogger(__name__)
+
+
+def expand_roots(patterns, roots_file=None):
+    """Список папок из путей, шаблонов glob и файла со списком; без повторов, в натуральном порядке шаблона."""
+    if roots_file:
+        with open(roots_file, encoding='utf-8') as f:
+            patterns = list(patterns) + [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    collator = Collator()
+    roots = []
+    seen = set()
+    for pattern in patterns:
+        matches = collator.sort(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logger.warning(f"Шаблон не совпал ни с одной папкой: {pattern}")
+        for match in matches:
+            root = Path(match)
+            if not root.is_dir():
+                logger.warning(f"Пропущено (не папка): {match}")
+                continue
+            key = str(root.resolve())
+            if key not in seen:
+                seen.add(key)
+                roots.append(root)
+    return roots
+
+
+def _scan_roots(roots, scan_options, scanned):
+    """Поток сканирования: сканирует папки по очереди и передаёт результаты (с метриками папки) в очередь scanned."""
+    for root in roots:
+        run_metrics = RunMetrics()
+        start = time.perf_counter()
+        try:
+            scan_result = scan_root(root, scan_options, run_metrics=run_metrics)
+            scanned.put((root, scan_result, None, time.perf_counter() - start, run_metrics))
+        except Exception as e:
+            scanned.put((root, None, str(e), time.perf_counter() - start, run_metrics))
+    scanned.put(None)
+
+
+def _output_path(root, output_dir, export_format, used_names):
+    name = root.name or root.resolve().name or "root"
+    candidate = name
+    index = 2
+    while candidate.lower() in used_names:
+        candidate = f"{name}_{index}"
+        index += 1
+    used_names.add(candidate.lower())
+    return output_dir / f"{candidate}.{export_format}"
+
+
+def run_batch(roots, output_dir, export_format, analysis_cache, analysis_executor, scan_options=None,
+              archive_expansion=True, archive_byte_budget=DEFAULT_ARCHIVE_BYTE_BUDGET, prefetch=1):
+    """
+    Инвентаризирует папки roots конвейером: пока анализируется одна папка, следующая сканируется
+    (не более prefetch отсканированных папок ждут анализа). Возвращает сводку с записью по каждой папке.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    scanned = queue.Queue(maxsize=max(1, prefetch))
+    scanner = threading.Thread(target=_scan_roots, args=(roots, scan_options, scanned), name='batch-scan', daemon=True)
+    used_names = set()
+    results = []
+    totals = {"roots": 0, "failed": 0, "files": 0, "analyzed_files": 0, "pages": 0}
+
+    start = time.perf_counter()
+    scanner.start()
+    while True:
+        item = scanned.get()
+        if item is None:
+            break
+        root, scan_result, error, scan_seconds, run_metrics = item
+        record = {"root": str(root), "scan_seconds": round(scan_seconds, 3)}
+        results.append(record)
+        totals["roots"] += 1
+        if error:
+            record["error"] = error
+            totals["failed"] += 1
+            logger.error(f"Папка {root} не обработана: {error}")
+            print(f"[{totals['roots']}/{len(roots)}] {root}: ошибка — {error}")
+            continue
+
+        stage_start = time.perf_counter()
+        try:
+            analysis = analyze_root(root, scan_result, analysis_cache, analysis_executor,
+                                    archive_expansion=archive_expansion, archive_byte_budget=archive_byte_budget,
+                                    run_metrics=run_metrics)
+            record["analysis_seconds"] = round(time.perf_counter() - stage_start, 3)
+            stage_start = time.perf_counter()
+            export_path = _output_path(root, output_dir, export_format, used_names)
+            with run_metrics.stage('export'):
+                record["rows"] = export_hierarchy(scan_result["tree"], export_path, export_format)
+            run_metrics.record('export', rows=record["rows"], bytes=export_path.stat().st_size)
+            record["export_seconds"] = round(time.perf_counter() - stage_start, 3)
+        except Exception as e:
+            record["error"] = str(e)
+            totals["failed"] += 1
+            logger.error(f"Папка {root} не обработана: {e}")
+            print(f"[{totals['roots']}/{len(roots)}] {root}: ошибка — {e}")
+            continue
+
+        tree = scan_result["tree"]
+        files = len(tree) - tree.kind.count(FOLDER)
+        pages = sum(page for page in tree.pages if page > 0)
+        record.update({
+            "output": str(export_path),
+            "files": files,
+            "analyzed_files": len(scan_result["files_to_analyze"]),
+            "pages": pages,
+            "analysis_cache": analysis["analysis_cache"],
+            "scan_errors": len(scan_result["errors"]),
+            "analysis_errors": len(analysis["analysis_errors"]),
+            "metrics": run_metrics.as_dict(),
+        })
+        totals["files"] += files
+        totals["analyzed_files"] += record["analyzed_files"]
+        totals["pages"] += pages
+        print(f"[{totals['roots']}/{len(roots)}] {root}: {files} файлов, {pages} страниц, "
+              f"сканирование {record['scan_seconds']:.2f} с, анализ {record['analysis_seconds']:.2f} с -> {export_path}")
+    scanner.join()
+
+    elapsed = time.perf_counter() - start
+    totals["seconds"] = round(elapsed, 3)
+    totals["files_per_second"] = round(totals["files"] / elapsed, 1) if elapsed else None
+    totals["pages_per_second"] = round(totals["pages"] / elapsed, 1) if elapsed else None
+    return {"totals": totals, "roots": results}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная инвентаризация папок с документами.")
+    parser.add_argument('roots', nargs='*', help="Папки или шаблоны glob (в кавычках, например \"/mnt/d/Orders/*\")")
+    parser.add_argument('--roots-file', help="Файл со списком папок или шаблонов, по одному на строку")
+    parser.add_argument('--output-dir', default='output/batch', help="Папка для выгрузок и summary.json")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="Формат выгрузки для каждой папки")
+    parser.add_argument('--cache', default='output/analysis_cache.sqlite', help="Файл кэша анализа (общий с веб-приложением)")
+    parser.add_argument('--executor', choices=EXECUTOR_MODES, default=os.environ.get('ANALYSIS_EXECUTOR', 'thread'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ANALYSIS_WORKERS', 0)),
+                        help="Потоков/процессов анализа (0 — по числу CPU)")
+    parser.add_argument('--batch-size', type=int, default=int(os.environ.get('ANALYSIS_BATCH_SIZE', 0)))
+    parser.add_argument('--file-timeout', type=float, default=float(os.environ.get('ANALYSIS_FILE_TIMEOUT', 120)),
+                        help="Секунд на анализ одного файла (0 — без ограничения)")
+    parser.add_argument('--scan-workers', type=int, default=int(os.environ.get('SCAN_WORKERS', 1)),
+                        help="Потоков чтения каталогов (больше 1 — для сетевых дисков)")
+    parser.add_argument('--prefetch', type=int, default=1, help="Сколько отсканированных папок может ждать анализа")
+    parser.add_argument('--no-archives', action='store_true', help="Не разворачивать содержимое архивов")
+    args = parser.parse_args(argv)
+    if not args.roots and not args.roots_file:
+        parser.error("укажите папки, шаблоны или --roots-file")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging()
+    # Та же локаль, что и в веб-приложении, чтобы порядок кириллических имён совпадал
+    try:
+        locale.setlocale(locale.LC_ALL, 'ru_RU.UTF-8')
+    except locale.Error:
+        logger.warning("Локаль ru_RU.UTF-8 не поддерживается, используется стандартная локаль")
+    roots = expand_roots(args.roots, args.roots_file)
+    if not roots:
+        print("Не найдено ни одной папки для обработки", file=sys.stderr)
+        return 2
+
+    Path(args.cache).parent.mkdir(parents=True, exist_ok=True)
+    analysis_cache = AnalysisCache(args.cache, max_entries=int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 200000)))
+    analysis_executor = AnalysisExecutor(mode=args.executor, workers=args.workers or None,
+                                         batch_size=args.batch_size, file_timeout=args.file_timeout or None)
+    print(f"Папок: {len(roots)}, исполнитель анализа: {args.executor} ({analysis_executor.workers}), "
+          f"потоков сканирования: {args.scan_workers}")
+    try:
+        summary = run_batch(roots, args.output_dir, args.format, analysis_cache, analysis_executor,
+                            scan_options={"workers": args.scan_workers},
+                            archive_expansion=not args.no_archives, prefetch=args.prefetch)
+    finally:
+        analysis_executor.shutdown()
+
+    totals = summary["totals"]
+    summary_path = Path(args.output_dir) / 'summary.json'
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    print(f"Итого: {totals['roots'] - totals['failed']} из {totals['roots']} папок, {totals['files']} файлов, "
+          f"{totals['pages']} страниц за {totals['seconds']:.2f} с — {totals['files_per_second']} файлов/с, "
+          f"{totals['pages_per_second']} страниц/с. Сводка: {summary_path}")
+    return 1 if totals['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Локальная замена Google Sheets API для бенчмарков: HTTP-сервер в потоке текущего процесса.
+
+Поддерживает вызовы, которые делает scripts/sheet_writer.SheetsApi: метаданные листов,
+чтение значений, spreadsheets.batchUpdate (addSheet, insertDimension, deleteDimension,
+форматирование принимается и не применяется) и values.batchUpdate. Листы хранятся
+в памяти, поэтому после записи можно проверять синхронизацию. latency добавляет задержку
+к каждому запросу, имитируя сетевой путь до Google.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+_RANGE_RE = re.compile(r"^'((?:[^']|'')*)'!A(\d*):[A-Z]+(\d*)$")
+
+
+class FakeSheetsServer:
+    """Контекстный менеджер: запускает сервер на свободном порту, base_url — адрес для SheetsApi."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sheets = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/v4/spreadsheets"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                fake._handle(self, 'GET', None)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                fake._handle(self, 'POST', body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-sheets', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = {}
+
+    def _count(self, kind):
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+
+    def _handle(self, handler, method, body):
+        if self.latency:
+            time.sleep(self.latency)
+        path = urlparse(handler.path).path
+        with self._lock:
+            if method == 'GET' and '/values/' in path:
+                self._count('values.get')
+                response = self._values_get(unquote(path.split('/values/', 1)[1]))
+            elif method == 'GET':
+                self._count('get')
+                response = {"sheets": [{"properties": {"sheetId": sheet["id"], "title": title}}
+                                       for title, sheet in self.sheets.items()]}
+            elif path.endswith('/values:batchUpdate'):
+                self._count('values.batchUpdate')
+                response = self._values_batch_update(body)
+            else:
+                self._count('batchUpdate')
+                response = self._batch_update(body)
+        data = json.dumps(response).encode('utf-8')
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _rows(self, range_name):
+        match = _RANGE_RE.match(range_name)
+        title = match.group(1).replace("''", "'")
+        return self.sheets[title]["rows"], int(match.group(2) or 1)
+
+    def _values_get(self, range_name):
+        rows, _ = self._rows(range_name)
+        # Как и Google, не возвращаем пустые ячейки в конце строк и пустые строки в конце листа
+        values = []
+        for row in rows:
+            row = list(row)
+            while row and row[-1] == "":
+                row.pop()
+            values.append(row)
+        while values and not values[-1]:
+            values.pop()
+        return {"values": values}
+
+    def _values_batch_update(self, body):
+        for data in body["data"]:
+            rows, start_row = self._rows(data["range"])
+            for offset, values in enumerate(data["values"]):
+                while len(rows) < start_row + offset:
+                    rows.append([])
+                rows[start_row - 1 + offset] = list(values)
+        return {"totalUpdatedRows": sum(len(data["values"]) for data in body["data"])}
+
+    def _sheet_by_id(self, sheet_id):
+        return next(sheet for sheet in self.sheets.values() if sheet["id"] == sheet_id)
+
+    def _batch_update(self, body):
+        for request in body["requests"]:
+            if "addSheet" in request:
+                properties = request["addSheet"]["properties"]
+                row_count = properties.get("gridProperties", {}).get("rowCount", 1000)
+                self.sheets[properties["title"]] = {"id": properties["sheetId"], "rows": [[] for _ in range(row_count)]}
+            elif "insertDimension" in request:
+                dimension = request["insertDimension"]["range"]
+                rows = self._sheet_by_id(dimension["sheetId"])["rows"]
+                rows[dimension["startIndex"]:dimension["startIndex"]] = [[] for _ in range(dimension["endIndex"] - dimension["startIndex"])]
+            elif "deleteDimension" in request:
+                dimension = request["deleteDimension"]["range"]
+                del self._sheet_by_id(dimension["sheetId"])["rows"][dimension["startIndex"]:dimension["endIndex"]]
+        return {"replies": [{} for _ in body["requests"]]}
@@ -0,0 +1,270 @@
+"""
+Бенчмарки конвейера инвентаризации на синтетическом дереве документов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.run --depth 3 --fanout 4 --files 20 --repeat 3
+    python -m benchmarks.run --compare benchmarks/results/<прошлый запуск>.json
+
+Каждая стадия (сканирование, разбор PDF, анализ с пустым и заполненным кэшем, разворачивание
+дерева, выгрузки, запись и синхронизация листа через локальную замену Sheets API) измеряется
+отдельно: время — медиана repeat запусков, пиковая память — отдельным запуском под tracemalloc.
+Результаты пишутся в JSON (по умолчанию benchmarks/results/<время>_<коммит>.json);
+--compare печатает изменения относительно прошлого результата и завершается с кодом 1,
+если какая-либо стадия стала медленнее больше чем на --threshold.
+"""
+import argparse
+import json
+import locale
+import logging
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+import requests
+from benchmarks.fake_sheets import FakeSheetsServer
+from benchmarks.tree_generator import TreeGenerator
+from scripts.analysis_cache import AnalysisCache
+from scripts.analysis_executor import AnalysisExecutor, EXECUTOR_MODES
+from scripts.archive_struct import scan_directory
+from scripts.collation import Collator
+from scripts.export import EXPORT_FORMATS, export_hierarchy
+from scripts.inventory import analyze_root
+from scripts.pdf_meta import read_pdf_metadata
+from scripts.sheet_writer import SheetsApi, flatten_tree, write_hierarchy_to_sheet
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+SYNC_WORKSHEET = "Бенчмарк"
+SPREADSHEET_URL = "https://docs.google.com/spreadsheets/d/benchmark/edit"
+
+
+def measure(func, repeat, setup=None):
+    """
+    Измеряет стадию: func(состояние от setup()) возвращает словарь с "items" (обработанных элементов)
+    и, при необходимости, дополнительными счётчиками. Возвращает (запись результата, последний результат func).
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        result = func(state)
+        times.append(time.perf_counter() - start)
+
+    state = setup() if setup else None
+    tracemalloc.start()
+    try:
+        func(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    seconds = statistics.median(times)
+    record = {
+        "seconds": round(seconds, 6),
+        "min_seconds": round(min(times), 6),
+        "runs": [round(value, 6) for value in times],
+        "peak_memory_bytes": peak,
+        "items": result["items"],
+        "items_per_second": round(result["items"] / seconds, 1) if seconds else None,
+    }
+    record.update({key: value for key, value in result.items() if key != "items"})
+    return record, result
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, cwd=Path(__file__).parent).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args, tree_root, work_dir):
+    stages = {}
+
+    def log_stage(name):
+        record = stages[name]
+        print(f"{name:<18} {record['seconds']:>9.4f} с  {record['items_per_second'] or 0:>12.1f} эл./с  "
+              f"пик {record['peak_memory_bytes'] / 1e6:>8.2f} МБ")
+
+    def scan():
+        return scan_directory(tree_root, collator=Collator(), workers=args.scan_workers)
+
+    # Сканирование
+    stages["scan"], _ = measure(lambda _: {"items": len(scan()["tree"])}, args.repeat)
+    log_stage("scan")
+
+    # Разбор метаданных PDF без исполнителя и кэша
+    pdf_paths = [tree_root / entry[0] for entry in scan()["files_to_analyze"] if entry[0].lower().endswith('.pdf')]
+
+    def parse_pdfs(_):
+        pages = 0
+        for path in pdf_paths:
+            pages += read_pdf_metadata(path)["pages"]
+        return {"items": len(pdf_paths), "pages": pages}
+
+    stages["pdf_metadata"], _ = measure(parse_pdfs, args.repeat)
+    log_stage("pdf_metadata")
+
+    # Анализ: пустой кэш (всё анализируется) и заполненный (только чтение кэша)
+    executor = AnalysisExecutor(mode=args.executor, workers=args.workers or None)
+    cache_counter = iter(range(1_000_000))
+
+    def cold_setup():
+        cache = AnalysisCache(work_dir / f"cache_{next(cache_counter)}.sqlite")
+        return scan(), cache
+
+    warm_cache = AnalysisCache(work_dir / 'cache_warm.sqlite')
+    analyze_root(tree_root, scan(), warm_cache, executor)
+
+    def analyze(state):
+        scan_result, cache = state
+        analysis = analyze_root(tree_root, scan_result, cache, executor)
+        analyzed = len(scan_result["files_to_analyze"]) + len(scan_result["archives"])
+        return {"items": analyzed, "tree": scan_result["tree"], "cache_hits": analysis["analysis_cache"]["hits"],
+                "errors": len(analysis["analysis_errors"])}
+
+    try:
+        stages["analysis_cold"], _ = measure(analyze, args.repeat, cold_setup)
+        stages["analysis_warm"], analyzed = measure(analyze, args.repeat, lambda: (scan(), warm_cache))
+    finally:
+        executor.shutdown()
+    tree = analyzed["tree"]
+    for name in ("analysis_cold", "analysis_warm"):
+        stages[name].pop("tree")
+        log_stage(name)
+
+    # Разворачивание дерева в строки листа
+    stages["flatten"], _ = measure(lambda _: {"items": len(flatten_tree(tree)[0])}, args.repeat)
+    log_stage("flatten")
+
+    # Потоковые выгрузки
+    for export_format in EXPORT_FORMATS:
+        export_path = work_dir / f"export.{export_format}"
+        stages[f"export_{export_format}"], _ = measure(
+            lambda _: {"items": export_hierarchy(tree, export_path, export_format),
+                       "bytes": export_path.stat().st_size}, args.repeat)
+        log_stage(f"export_{export_format}")
+
+    # Запись в Google Sheets через локальную замену API
+    with FakeSheetsServer(latency=args.sheets_latency) as server, requests.Session() as session:
+        def write_sheet(sync_worksheet=None):
+            api = SheetsApi(session, base_url=server.base_url)
+            _, summary = write_hierarchy_to_sheet(tree, SPREADSHEET_URL, api=api, sync_worksheet=sync_worksheet)
+            result = {"items": summary["total_items"], "api_calls": summary["api_calls"], "api_retries": summary["api_retries"]}
+            if "sync" in summary:
+                result["sync"] = summary["sync"]
+            return result
+
+        stages["sheets_write"], _ = measure(lambda _: write_sheet(), args.repeat)
+        log_stage("sheets_write")
+        write_sheet(SYNC_WORKSHEET)
+        stages["sheets_sync_noop"], _ = measure(lambda _: write_sheet(SYNC_WORKSHEET), args.repeat)
+        log_stage("sheets_sync_noop")
+    return stages
+
+
+def compare(current, previous_path, threshold):
+    """Печатает изменения по стадиям относительно прошлого результата; True — если есть регрессии."""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"\nСравнение с {previous_path} (коммит {previous.get('commit')}):")
+    regressions = []
+    for name, record in current["stages"].items():
+        old = previous.get("stages", {}).get(name)
+        if not old:
+            print(f"{name:<18} новая стадия")
+            continue
+        time_ratio = record["seconds"] / old["seconds"] if old["seconds"] else float('inf')
+        memory_ratio = record["peak_memory_bytes"] / old["peak_memory_bytes"] if old["peak_memory_bytes"] else float('inf')
+        marker = ""
+        if time_ratio > 1 + threshold:
+            marker = "  <-- медленнее"
+            regressions.append(name)
+        print(f"{name:<18} время x{time_ratio:.2f} ({old['seconds']:.4f} -> {record['seconds']:.4f} с), "
+              f"память x{memory_ratio:.2f}{marker}")
+    if current.get("params") != previous.get("params"):
+        print("Внимание: параметры запусков различаются, сравнение может быть некорректным")
+    return bool(regressions)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки инвентаризации на синтетическом дереве.")
+    parser.add_argument('--depth', type=int, default=3, help="Глубина дерева папок")
+    parser.add_argument('--fanout', type=int, default=4, help="Подпапок в каждой папке")
+    parser.add_argument('--files', type=int, default=20, help="Файлов в каждой папке")
+    parser.add_argument('--max-pages', type=int, default=40, help="Максимум страниц в PDF/DOCX")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3, help="Запусков каждой стадии (берётся медиана)")
+    parser.add_argument('--executor', choices=EXECUTOR_MODES, default='thread')
+    parser.add_argument('--workers', type=int, default=0, help="Потоков/процессов анализа (0 — по числу CPU)")
+    parser.add_argument('--scan-workers', type=int, default=1)
+    parser.add_argument('--sheets-latency', type=float, default=0.0, help="Задержка каждого запроса к замене Sheets API, с")
+    parser.add_argument('--tree-dir', help="Папка для дерева (по умолчанию временная, удаляется после запуска)")
+    parser.add_argument('--output', help="Файл результатов JSON")
+    parser.add_argument('--compare', help="JSON прошлого запуска для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.10, help="Допустимое замедление стадии при сравнении")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        locale.setlocale(locale.LC_ALL, 'ru_RU.UTF-8')
+    except locale.Error:
+        pass
+    # Построчные сообщения конвейера искажают замеры — оставляем только предупреждения
+    logging.getLogger().setLevel(logging.WARNING)
+
+    work_dir = Path(tempfile.mkdtemp(prefix='inventory_bench_'))
+    tree_root = Path(args.tree_dir) if args.tree_dir else work_dir / 'tree'
+    try:
+        generator = TreeGenerator(depth=args.depth, fanout=args.fanout, files_per_folder=args.files,
+                                  max_pages=args.max_pages, seed=args.seed)
+        if tree_root.exists() and any(tree_root.iterdir()):
+            print(f"Используется существующее дерево: {tree_root}")
+            tree_stats = None
+        else:
+            start = time.perf_counter()
+            tree_stats = generator.generate(tree_root)
+            tree_stats["generate_seconds"] = round(time.perf_counter() - start, 3)
+            print(f"Сгенерировано: {tree_stats['folders']} папок, {tree_stats['files']} файлов, "
+                  f"{tree_stats['bytes'] / 1e6:.1f} МБ, {tree_stats['pages']} страниц")
+        stages = run_benchmarks(args, tree_root, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result = {
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {key: getattr(args, key) for key in
+                   ("depth", "fanout", "files", "max_pages", "seed", "repeat", "executor", "workers",
+                    "scan_workers", "sheets_latency")},
+        "tree": tree_stats,
+        "stages": stages,
+    }
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{result['commit'] or 'nogit'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"Результаты: {output}")
+
+    if args.compare and compare(result, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
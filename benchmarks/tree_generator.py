@@ -0,0 +1,152 @@
+"""
+Генератор детерминированных синтетических деревьев документов для бенчмарков.
+
+Одинаковые параметры и seed дают побайтно одинаковое дерево: папки заданной глубины
+и ветвления с кириллическими именами, PDF с разным числом страниц и ориентацией
+(MediaBox и Rotate, в том числе унаследованные от /Pages), DOCX и XLSX с метаданными
+в docProps/app.xml, ZIP-архивы с документами внутри и служебные файлы .db.
+"""
+import io
+import os
+import random
+import zipfile
+
+FOLDER_WORDS = ("Том", "Раздел", "Часть", "Книга", "Альбом", "Приложение", "Чертежи", "Смета", "Документы")
+FILE_WORDS = ("Лист", "Чертёж", "Схема", "План", "Ведомость", "Спецификация", "Пояснительная записка", "Акт")
+PAGE_SIZES = ((595, 842), (842, 595), (842, 1191), (1191, 842), (612, 792))
+
+# Доли типов файлов в папке
+FILE_KIND_WEIGHTS = (("pdf", 60), ("docx", 10), ("xlsx", 8), ("txt", 10), ("zip", 4), ("db", 3), ("dwg", 5))
+
+_APP_XML_DOCX = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+                 '<Application>Microsoft Office Word</Application><Pages>{pages}</Pages></Properties>')
+_APP_XML_XLSX = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties" '
+                 'xmlns:vt="http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes">'
+                 '<Application>Microsoft Excel</Application><HeadingPairs><vt:vector size="2" baseType="variant">'
+                 '<vt:variant><vt:lpstr>Листы</vt:lpstr></vt:variant><vt:variant><vt:i4>{sheets}</vt:i4></vt:variant>'
+                 '</vt:vector></HeadingPairs></Properties>')
+_WORKBOOK_XML = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>{sheets}</sheets></workbook>')
+
+
+def make_pdf(pages, width, height, rotate=0, inherit_media_box=False):
+    """Минимальный корректный PDF с таблицей xref: pages страниц размера width x height."""
+    media_box = f"/MediaBox [0 0 {width} {height}]"
+    kids = " ".join(f"{number} 0 R" for number in range(3, 3 + pages))
+    pages_dict = f"<< /Type /Pages /Kids [{kids}] /Count {pages}{' ' + media_box if inherit_media_box else ''} >>"
+    page_dict = (f"<< /Type /Page /Parent 2 0 R{'' if inherit_media_box else ' ' + media_box}"
+                 f"{f' /Rotate {rotate}' if rotate else ''} /Resources << >> >>")
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", pages_dict] + [page_dict] * pages
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode('ascii'))
+    xref_offset = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii'))
+    out.write("".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('ascii'))
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode('ascii'))
+    return out.getvalue()
+
+
+def _office_zip(members):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), data)
+    return out.getvalue()
+
+
+def make_docx(pages):
+    return _office_zip([
+        ("[Content_Types].xml", '<?xml version="1.0"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>'),
+        ("word/document.xml", '<?xml version="1.0"?><w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"/>'),
+        ("docProps/app.xml", _APP_XML_DOCX.format(pages=pages)),
+    ])
+
+
+def make_xlsx(sheets):
+    sheet_elements = "".join(f'<sheet name="Лист{index}" sheetId="{index}" r:id="rId{index}"/>' for index in range(1, sheets + 1))
+    return _office_zip([
+        ("[Content_Types].xml", '<?xml version="1.0"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>'),
+        ("xl/workbook.xml", _WORKBOOK_XML.format(sheets=sheet_elements)),
+        ("docProps/app.xml", _APP_XML_XLSX.format(sheets=sheets)),
+    ])
+
+
+class TreeGenerator:
+    """
+    Создаёт дерево в root: depth уровней папок, fanout подпапок и files_per_folder файлов в каждой.
+    max_pages ограничивает число страниц PDF/DOCX. Возвращает статистику созданного дерева.
+    """
+
+    def __init__(self, depth=3, fanout=4, files_per_folder=20, max_pages=40, seed=1):
+        self.depth = depth
+        self.fanout = fanout
+        self.files_per_folder = files_per_folder
+        self.max_pages = max_pages
+        self.seed = seed
+
+    def generate(self, root):
+        rng = random.Random(self.seed)
+        stats = {"folders": 0, "files": 0, "bytes": 0, "pages": 0, "by_kind": {}}
+        stack = [(str(root), 0)]
+        os.makedirs(root, exist_ok=True)
+        while stack:
+            path, level = stack.pop()
+            stats["folders"] += 1
+            for index in range(self.files_per_folder):
+                self._write_file(rng, path, index, stats)
+            if level < self.depth:
+                for index in range(self.fanout):
+                    name = f"{index + 1}. {rng.choice(FOLDER_WORDS)} {rng.randint(1, 30)}"
+                    sub_path = os.path.join(path, name)
+                    os.makedirs(sub_path, exist_ok=True)
+                    stack.append((sub_path, level + 1))
+        return stats
+
+    def _document(self, rng, kind):
+        """(данные, страницы) для документа указанного типа."""
+        if kind == "pdf":
+            pages = rng.randint(1, self.max_pages)
+            width, height = rng.choice(PAGE_SIZES)
+            rotate = rng.choice((0, 0, 0, 90, 270))
+            return make_pdf(pages, width, height, rotate, inherit_media_box=rng.random() < 0.3), pages
+        if kind == "docx":
+            pages = rng.randint(1, self.max_pages)
+            return make_docx(pages), pages
+        sheets = rng.randint(1, 8)
+        return make_xlsx(sheets), sheets
+
+    def _write_file(self, rng, path, index, stats):
+        kinds, weights = zip(*FILE_KIND_WEIGHTS)
+        kind = rng.choices(kinds, weights)[0]
+        name = f"{rng.choice(FILE_WORDS)} {index + 1}"
+        pages = 0
+        if kind in ("pdf", "docx", "xlsx"):
+            data, pages = self._document(rng, kind)
+        elif kind == "zip":
+            members = []
+            for member_index in range(rng.randint(2, 6)):
+                member_kind = rng.choice(("pdf", "pdf", "docx", "xlsx"))
+                member_data, member_pages = self._document(rng, member_kind)
+                folder = rng.choice(("", "Исходные/", "Исходные/Подписанные/"))
+                members.append((f"{folder}{rng.choice(FILE_WORDS)} {member_index + 1}.{member_kind}", member_data))
+                pages += member_pages
+            data = _office_zip(members)
+        elif kind == "db":
+            data = bytes(rng.getrandbits(8) for _ in range(256))
+        else:
+            data = f"Файл {name}\n".encode('utf-8') * rng.randint(1, 50)
+        file_path = os.path.join(path, f"{name}.{kind}")
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        stats["files"] += 1
+        stats["bytes"] += len(data)
+        stats["pages"] += pages
+        stats["by_kind"][kind] = stats["by_kind"].get(kind, 0) + 1
@@ -0,0 +1,98 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Увеличивается при изменении анализаторов: записи старой версии сбрасываются при открытии кэша
+CACHE_VERSION = 2
+
+
+class AnalysisCache:
+    """
+    Дисковый кэш результатов анализа файлов (SQLite).
+
+    Запись идентифицируется корневой папкой и относительным путём и считается
+    актуальной, пока совпадают размер файла и mtime_ns. Число записей ограничено
+    max_entries: при превышении удаляются записи, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, db_path, max_entries=200000):
+        self.db_path = str(db_path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] != CACHE_VERSION:
+                self._conn.execute("DROP TABLE IF EXISTS analysis")
+                self._conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS analysis (
+                    root TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    metrics TEXT NOT NULL,
+                    last_access INTEGER NOT NULL,
+                    PRIMARY KEY (root, path)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS analysis_last_access ON analysis (last_access)")
+
+    def get_many(self, root, entries):
+        """
+        Возвращает {path: metrics} для актуальных записей.
+        entries — итерируемое из кортежей (path, size, mtime_ns).
+        """
+        found = {}
+        now = time.time_ns()
+        with self._lock, self._conn:
+            for path, size, mtime_ns in entries:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns, metrics FROM analysis WHERE root = ? AND path = ?",
+                    (root, path)
+                ).fetchone()
+                if row and row[0] == size and row[1] == mtime_ns:
+                    found[path] = json.loads(row[2])
+            if found:
+                self._conn.executemany(
+                    "UPDATE analysis SET last_access = ? WHERE root = ? AND path = ?",
+                    [(now, root, path) for path in found]
+                )
+        return found
+
+    def put_many(self, root, items):
+        """Сохраняет результаты анализа. items — итерируемое из кортежей (path, size, mtime_ns, metrics)."""
+        now = time.time_ns()
+        rows = [(root, path, size, mtime_ns, json.dumps(metrics, ensure_ascii=False), now)
+                for path, size, mtime_ns, metrics in items]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO analysis (root, path, size, mtime_ns, metrics, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+
+    def invalidate_root(self, root):
+        """Удаляет все записи для корневой папки. Возвращает количество удалённых записей."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM analysis WHERE root = ?", (root,))
+        logger.info(f"Кэш анализа очищен для {root}: удалено {cursor.rowcount} записей")
+        return cursor.rowcount
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COUNT(*) FROM analysis").fetchone()[0]
+        excess = total - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM analysis WHERE rowid IN "
+                "(SELECT rowid FROM analysis ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+            logger.info(f"Кэш анализа: вытеснено {excess} записей")
@@ -0,0 +1,239 @@
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_MODES = ('thread', 'process', 'serial')
+
+# Состояние исполнителя пула: очередь, в которую он сообщает о фактическом начале пачки
+_worker_state = threading.local()
+
+
+class AnalysisTimeout(Exception):
+    """Анализ файла не уложился в отведённое время."""
+
+
+def _alarm_available():
+    # Прервать зависший разбор можно только сигналом в главном потоке процесса
+    # (рабочий процесс пула или последовательный режим вне Flask)
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+
+def _call_with_timeout(func, file_path, file_timeout):
+    if not (file_timeout and _alarm_available()):
+        return func(file_path)
+
+    def on_alarm(signum, frame):
+        raise AnalysisTimeout(f"Превышено время анализа ({file_timeout} с)")
+
+    previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, file_timeout)
+    try:
+        return func(file_path)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _init_worker(start_queue):
+    _worker_state.start_queue = start_queue
+
+
+def analyze_batch(func, file_paths, file_timeout=None, batch_id=None):
+    """
+    Анализирует пачку файлов в одном задании пула.
+    Возвращает список (file_path, metrics, error, seconds); ошибка одного файла не прерывает пачку.
+    Если задан batch_id, о начале пачки сообщается в очередь исполнителя (для отсчёта тайм-аута).
+    """
+    start_queue = getattr(_worker_state, 'start_queue', None)
+    if batch_id is not None and start_queue is not None:
+        start_queue.put((batch_id, time.monotonic()))
+    results = []
+    for file_path in file_paths:
+        start = time.perf_counter()
+        try:
+            _, metrics = _call_with_timeout(func, file_path, file_timeout)
+            results.append((file_path, metrics, None, time.perf_counter() - start))
+        except Exception as e:
+            results.append((file_path, None, str(e) or type(e).__name__, time.perf_counter() - start))
+    return results
+
+
+class AnalysisExecutor:
+    """
+    Исполнитель стадии анализа: потоки, процессы или последовательный режим.
+
+    Пул создаётся лениво и переиспользуется между запросами. В режиме процессов
+    файлы группируются в пачки, чтобы уменьшить накладные расходы на передачу
+    заданий. Тайм-аут на файл в рабочих процессах (POSIX) прерывает сам разбор;
+    в остальных случаях время пачки отсчитывается с момента, когда исполнитель
+    действительно её начал (о чём он сообщает через очередь пула), и зависшая пачка
+    помечается как превысившая время и больше
+    не ожидается, а пул выводится из работы: новые пачки идут в новый пул, ещё не
+    начатые пачки всех одновременных вызовов map() переносятся в него же. Зависшие
+    рабочие процессы выведенного пула завершаются, когда не остаётся активных map();
+    зависший поток прервать нельзя, он лишь перестаёт получать задания.
+    Последовательный режим с тайм-аутом вне главного потока (например, в задании
+    веб-приложения), где сигнал недоступен, анализирует файлы в одном рабочем процессе
+    под тем же контролем времени.
+    """
+
+    def __init__(self, mode='thread', workers=None, batch_size=0, file_timeout=None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Неизвестный режим исполнителя: {mode}. Допустимо: {', '.join(EXECUTOR_MODES)}")
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.file_timeout = file_timeout
+        self._pool = None
+        self._retired = []
+        self._active_maps = 0
+        self._start_queues = {}
+        self._started = {}
+        self._batch_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # Будущее пула процессов считается запущенным уже в очереди вызовов, поэтому
+                # начало пачки исполнитель сообщает сам — через очередь, своя у каждого пула
+                if self.mode in ('process', 'serial'):
+                    start_queue = multiprocessing.SimpleQueue()
+                    self._pool = ProcessPoolExecutor(max_workers=self._pool_workers, initializer=_init_worker,
+                                                     initargs=(start_queue,))
+                else:
+                    start_queue = queue.SimpleQueue()
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                    initargs=(start_queue,))
+                self._start_queues[self._pool] = start_queue
+                logger.info(f"Создан пул анализа: режим {self.mode}, {self._pool_workers} исполнителей")
+            return self._pool
+
+    @property
+    def _pool_workers(self):
+        # Последовательный режим использует пул только ради тайм-аута — один процесс
+        return 1 if self.mode == 'serial' else self.workers
+
+    def _retire_pool(self, pool):
+        """Выводит пул с зависшей пачкой из работы; уже начатые в нём пачки других вызовов доработают."""
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+            # Словарь процессов берём до shutdown, который обнуляет ссылку на него
+            self._retired.append((pool, getattr(pool, '_processes', None) or {}))
+        pool.shutdown(wait=False)
+        logger.warning("Пул анализа выведен из работы после превышения времени, создаётся новый")
+
+    def _terminate_retired(self):
+        with self._lock:
+            retired, self._retired = self._retired, []
+        for pool, processes in retired:
+            for process in list(processes.values()):
+                process.terminate()
+            with self._lock:
+                self._start_queues.pop(pool, None)
+
+    def _collect_starts(self):
+        """Переносит сообщения исполнителей о начале пачек в self._started (batch_id -> monotonic)."""
+        with self._lock:
+            for start_queue in self._start_queues.values():
+                while not start_queue.empty():
+                    batch_id, started_at = start_queue.get()
+                    self._started[batch_id] = started_at
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+            with self._lock:
+                self._start_queues.pop(pool, None)
+        self._terminate_retired()
+
+    def _batches(self, file_paths):
+        batch_size = self.batch_size
+        if not batch_size:
+            # Пачки нужны только процессам; для потоков каждый файл — отдельное задание
+            batch_size = max(1, min(32, math.ceil(len(file_paths) / (self._pool_workers * 4)))) if self.mode != 'thread' else 1
+        for i in range(0, len(file_paths), batch_size):
+            yield file_paths[i:i + batch_size]
+
+    def map(self, func, file_paths):
+        """
+        Генератор результатов анализа в порядке завершения: (file_path, metrics, error, seconds),
+        где seconds — время анализа файла в исполнителе (0, если файл не был проанализирован).
+        func(file_path) должна возвращать (file_path, metrics) и выбрасывать исключение при ошибке.
+        """
+        file_paths = list(file_paths)
+        if not file_paths:
+            return
+        if self.mode == 'serial' and (not self.file_timeout or _alarm_available()):
+            for batch in self._batches(file_paths):
+                yield from analyze_batch(func, batch, self.file_timeout)
+            return
+
+        with self._lock:
+            self._active_maps += 1
+        pending = {}
+
+        def submit(batch):
+            pool = self._get_pool()
+            batch_id = next(self._batch_ids) if self.file_timeout else None
+            pending[pool.submit(analyze_batch, func, batch, self.file_timeout, batch_id)] = (batch, pool, batch_id)
+
+        poll_interval = min(1.0, self.file_timeout / 4) if self.file_timeout else None
+        try:
+            for batch in self._batches(file_paths):
+                submit(batch)
+            while pending:
+                done, _ = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, _, batch_id = pending.pop(future)
+                    self._started.pop(batch_id, None)
+                    try:
+                        yield from future.result()
+                    except Exception as e:
+                        yield from ((file_path, None, str(e) or type(e).__name__, 0.0) for file_path in batch)
+                if not self.file_timeout:
+                    continue
+                self._collect_starts()
+                now = time.monotonic()
+                for future, (batch, pool, batch_id) in list(pending.items()):
+                    if pool is not self._pool and future.cancel():
+                        # Пул выведен из работы (зависание в этом или другом вызове) — пачка ещё
+                        # не начата, переносим её в новый пул, а не ждём занятых исполнителей
+                        pending.pop(future)
+                        submit(batch)
+                        continue
+                    # Пачка, ещё стоящая в очереди пула, не отсчитывает время и не выводит пул из работы
+                    started_at = self._started.get(batch_id)
+                    if started_at is None:
+                        continue
+                    # Запас в один тайм-аут на случай, если сигнал в исполнителе недоступен
+                    if now - started_at > self.file_timeout * (len(batch) + 1):
+                        pending.pop(future)
+                        self._started.pop(batch_id, None)
+                        future.cancel()
+                        self._retire_pool(pool)
+                        error = f"Превышено время анализа ({self.file_timeout} с)"
+                        yield from ((file_path, None, error, now - started_at) for file_path in batch)
+        finally:
+            # Потребитель прекратил чтение (например, задание отменено) — снимаем ещё не начатые пачки
+            for future, (_, _, batch_id) in pending.items():
+                future.cancel()
+                self._started.pop(batch_id, None)
+            with self._lock:
+                self._active_maps -= 1
+                last = self._active_maps == 0
+            if last:
+                self._terminate_retired()
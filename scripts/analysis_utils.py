@@ -1,38 +1,78 @@
+import io
 import logging
-import pdfplumber
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+import zipfile
+from xml.etree import ElementTree
+from scripts.pdf_meta import FileRange, read_pdf_metadata
+
 logger = logging.getLogger(__name__)
 
-def count_pdf_pages(file_path):
-    """Подсчёт страниц в PDF-файле."""
-    try:
-        logger.info(f"Попытка открыть PDF: {file_path}")
-        with pdfplumber.open(file_path) as pdf:
-            page_count = len(pdf.pages)
-            logger.info(f"Успешно подсчитано {page_count} страниц для файла: {file_path}")
-            return file_path, page_count
-    except Exception as e:
-        logger.error(f"Ошибка при обработке {file_path}: {str(e)}")
-        return file_path, 0
-
-def get_page_size(file_path):
-    """Определяет ориентацию страницы: альбомный или книжный."""
-    try:
-        with pdfplumber.open(file_path) as pdf:
-            page = pdf.pages[0]
-            width, height = page.width, page.height
-            if width is None or height is None:
-                return "Error: Unable to get size"
-            return "альбомный" if width > height else "книжный"
-    except Exception as e:
-        logger.error(f"Ошибка получения ориентации страницы для {file_path}: {str(e)}")
-        return f"Error: {str(e)}"
\ No newline at end of file
+
+# Расширенные свойства документа Office Open XML (docProps/app.xml)
+_APP_PROPERTIES_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}'
+_VT_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes}'
+
+
+def _read_zip_member(file_path, member):
+    """Читает один член zip-контейнера; остальное содержимое документа не распаковывается."""
+    if isinstance(file_path, FileRange):
+        file_path = io.BytesIO(file_path.read())
+    with zipfile.ZipFile(file_path) as archive:
+        try:
+            return archive.read(member)
+        except KeyError:
+            return None
+
+
+def analyze_pdf(file_path):
+    """Количество страниц и ориентация первой страницы PDF."""
+    return read_pdf_metadata(file_path)
+
+
+def analyze_docx(file_path):
+    """Количество страниц DOCX из docProps/app.xml (значение, сохранённое редактором)."""
+    app_xml = _read_zip_member(file_path, 'docProps/app.xml')
+    pages = ""
+    if app_xml:
+        element = ElementTree.fromstring(app_xml).find(f'{_APP_PROPERTIES_NS}Pages')
+        if element is not None and (element.text or '').strip().isdigit():
+            pages = int(element.text)
+    return {"pages": pages, "size": ""}
+
+
+def analyze_xlsx(file_path):
+    """Количество листов XLSX из docProps/app.xml, при неоднозначности — из xl/workbook.xml."""
+    app_xml = _read_zip_member(file_path, 'docProps/app.xml')
+    if app_xml:
+        # HeadingPairs — пары (группа, количество): листы, именованные диапазоны и т.д.
+        # Названия групп локализованы, поэтому доверяем только единственной группе.
+        heading_pairs = ElementTree.fromstring(app_xml).find(f'{_APP_PROPERTIES_NS}HeadingPairs')
+        if heading_pairs is not None:
+            counts = [element.text for element in heading_pairs.iter(f'{_VT_NS}i4')]
+            if len(counts) == 1 and counts[0].strip().isdigit():
+                return {"pages": int(counts[0]), "size": ""}
+    workbook_xml = _read_zip_member(file_path, 'xl/workbook.xml')
+    if workbook_xml is None:
+        raise ValueError("В файле нет xl/workbook.xml")
+    sheets = ElementTree.fromstring(workbook_xml).find('{http://schemas.openxmlformats.org/spreadsheetml/2006/main}sheets')
+    return {"pages": len(sheets) if sheets is not None else 0, "size": ""}
+
+
+# Реестр анализаторов по расширению файла
+ANALYZERS = {
+    '.pdf': analyze_pdf,
+    '.docx': analyze_docx,
+    '.xlsx': analyze_xlsx,
+}
+
+
+def analyze_file(file_path):
+    """
+    Анализ файла анализатором, зарегистрированным для его расширения.
+    При ошибке выбрасывает исключение, чтобы исполнитель анализа сообщил о ней по конкретному файлу.
+    """
+    analyzer = ANALYZERS.get(file_path.suffix.lower())
+    if analyzer is None:
+        raise ValueError(f"Нет анализатора для файлов {file_path.suffix}")
+    metrics = analyzer(file_path)
+    logger.debug(f"Проанализирован файл {file_path}: {metrics['pages']} страниц")
+    return file_path, metrics
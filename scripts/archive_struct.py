@@ -1,71 +1,277 @@
 from pathlib import Path
-from collections import deque
-from natsort import natsorted, ns
+import io
+import os
+import shutil
+import struct
+import tempfile
+from contextlib import contextmanager
+from functools import partial
 import rarfile
 import zipfile
+from scripts.analysis_utils import ANALYZERS
+from scripts.collation import Collator
+from scripts.pdf_meta import FileRange
+from scripts.traversal import WorkStealingLister, serial_listings
+from scripts.tree_model import ARCHIVE_EXTENSIONS, FOLDER, NodeTable, file_kind
 
-# Функция get_archive_structure больше не используется, но оставлена закомментированной
-"""
-def get_archive_structure(archive_path):
-    \"\"\"Получает структуру архива (RAR/ZIP) с натуральной сортировкой, игнорируя файлы .db.\"\"\"
-    structure = []
+# Сколько байт распакованных членов архива можно прочитать для анализа (на один архив)
+DEFAULT_ARCHIVE_BYTE_BUDGET = 256 * 1024 * 1024
+# Сжатый член архива больше этого размера распаковывается во временный файл, а не в память
+DEFAULT_ARCHIVE_MEMBER_MEMORY_LIMIT = 16 * 1024 * 1024
+
+
+def _build_structure(tree, collator):
+    """Преобразует вложенный словарь {имя: словарь | None} в список [{папка: [...]}, "файл", ...]."""
+    result = []
+    folders = [(k, v) for k, v in tree.items() if isinstance(v, dict) and v]
+    files = [k for k, v in tree.items() if not isinstance(v, dict)]
+    folders = collator.sort(folders, key=lambda x: x[0])
+    files = collator.sort(files)
+    for key, value in folders:
+        result.append({key: _build_structure(value, collator)})
+    result.extend(files)
+    return result
+
+
+def _zip_data_offset(archive_path, item):
+    """Смещение данных члена ZIP в файле архива (после локального заголовка)."""
+    with open(archive_path, 'rb') as f:
+        f.seek(item.header_offset)
+        header = f.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader:
+        raise zipfile.BadZipFile(f"Обрезан локальный заголовок {item.filename}")
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    if fields[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Неверный локальный заголовок {item.filename}")
+    name_length, extra_length = fields[-2:]
+    return item.header_offset + zipfile.sizeFileHeader + name_length + extra_length
+
+
+def _is_stored(archive, item):
+    """Член ZIP хранится без сжатия и шифрования — его данные можно читать прямо из архива."""
+    return isinstance(archive, zipfile.ZipFile) and item.compress_type == zipfile.ZIP_STORED and not item.flag_bits & 0x1
+
+
+@contextmanager
+def _open_member(archive, item, archive_path, memory_limit):
+    """
+    Открывает анализируемый член архива, не распаковывая его целиком в память.
+
+    Возвращает (источник для анализатора, число распакованных байт). Несжатый член ZIP
+    читается прямо из файла архива по смещению данных (FileRange), без распаковки;
+    сжатый распаковывается потоком — в память, если не больше memory_limit, иначе во
+    временный файл, который анализатор PDF отображает в память.
+    """
+    if _is_stored(archive, item):
+        yield FileRange(archive_path, _zip_data_offset(archive_path, item), item.file_size), 0
+        return
+    with archive.open(item) as member:
+        if item.file_size <= memory_limit:
+            data = member.read()
+            yield io.BytesIO(data), len(data)
+            return
+        with tempfile.TemporaryFile() as spool:
+            shutil.copyfileobj(member, spool, 1024 * 1024)
+            unpacked = spool.tell()
+            spool.flush()
+            spool.seek(0)
+            yield spool, unpacked
+
+
+def get_archive_structure(archive_path, byte_budget=DEFAULT_ARCHIVE_BYTE_BUDGET,
+                          memory_limit=DEFAULT_ARCHIVE_MEMBER_MEMORY_LIMIT):
+    """
+    Потоковая инвентаризация архива (RAR/ZIP) без распаковки на диск, игнорируя файлы .db.
+
+    Список членов берётся только из центрального каталога ZIP или заголовков RAR.
+    Анализируемые члены (PDF, DOCX, XLSX) открываются по одному: несжатые члены ZIP
+    читаются по диапазону прямо из архива, сжатые распаковываются потоком (не больше
+    memory_limit байт в памяти на член, остальное — во временный файл), пока не исчерпан
+    byte_budget распакованных байт; остальные остаются без метрик.
+    Возвращает (archive_path, {"structure": [...], "analysis": {путь члена: метрики}, "errors": [...]}).
+    """
+    archive_path = Path(archive_path)
     archive_type = archive_path.suffix.lower()
+    if archive_type == '.rar':
+        archive = rarfile.RarFile(archive_path)
+    else:
+        # Имена без флага UTF-8 в архивах из русской Windows записаны в cp866
+        archive = zipfile.ZipFile(archive_path, metadata_encoding='cp866')
+
+    tree = {}
+    analysis = {}
+    errors = []
+    remaining_budget = byte_budget
+    collator = Collator()
+    with archive:
+        members = [item for item in archive.infolist()
+                   if not item.is_dir() and not item.filename.lower().endswith('.db')]
+        for item in members:
+            path_parts = [part for part in item.filename.replace('\\', '/').split('/') if part]
+            if not path_parts:
+                continue
+            current = tree
+            for part in path_parts[:-1]:
+                if not isinstance(current.get(part), dict):
+                    current[part] = {}
+                current = current[part]
+            current.setdefault(path_parts[-1], None)
+
+        for item in collator.sort(members, key=lambda x: x.filename):
+            member_path = '/'.join(part for part in item.filename.replace('\\', '/').split('/') if part)
+            analyzer = ANALYZERS.get(Path(member_path).suffix.lower())
+            if analyzer is None:
+                continue
+            # Несжатые члены ZIP не распаковываются и лимит не расходуют
+            if not _is_stored(archive, item) and item.file_size > remaining_budget:
+                errors.append({"path": member_path, "error": "Превышен лимит чтения архива"})
+                continue
+            try:
+                with _open_member(archive, item, archive_path, memory_limit) as (source, unpacked):
+                    remaining_budget -= unpacked
+                    analysis[member_path] = analyzer(source)
+            except rarfile.RarCannotExec as e:
+                # Без unrar/unar члены RAR не читаются — остальные попытки бессмысленны
+                errors.append({"path": member_path, "error": str(e)})
+                break
+            except Exception as e:
+                errors.append({"path": member_path, "error": str(e) or type(e).__name__})
+
+    return archive_path, {"structure": _build_structure(tree, collator), "analysis": analysis, "errors": errors}
+
+
+ANALYZED_EXTENSIONS = tuple(ANALYZERS)
+
+
+def _list_directory(task, collator, max_depth=None):
+    """
+    Читает один каталог: задача (путь, относительный префикс, глубина).
+
+    Возвращает ((префикс, глубина, имена подпапок, файлы, ошибка), дочерние задачи).
+    Файлы — кортежи (имя, размер, mtime_ns, ошибка); размер и mtime читаются только
+    для анализируемых файлов и архивов. Подпапки глубже max_depth не читаются.
+    """
+    current_path, prefix, depth = task
     try:
-        opener = rarfile.RarFile if archive_type == '.rar' else zipfile.ZipFile
-        with opener(archive_path) as archive:
-            temp_dict = {}
-            for item in archive.infolist():
-                if hasattr(item, 'is_dir') and item.is_dir():
-                    continue
-                if item.filename.lower().endswith('.db'):
-                    continue
-                path_parts = item.filename.split('/')
-                current = temp_dict
-                for part in path_parts[:-1]:
-                    if part and part not in current:
-                        current[part] = {}
-                    if part:
-                        current = current[part]
-                if path_parts[-1]:
-                    current[path_parts[-1]] = "file"
-
-            def dict_to_list(d):
-                result = []
-                folders = [(k, v) for k, v in d.items() if isinstance(v, dict) and v]
-                files = [k for k, v in d.items() if not isinstance(v, dict)]
-                folders = natsorted(folders, key=lambda x: x[0], alg=ns.LOCALE)
-                files = natsorted(files, alg=ns.LOCALE)
-                for key, value in folders:
-                    result.append({key: dict_to_list(value)})
-                result.extend(files)
-                return result
-
-            structure = dict_to_list(temp_dict)
-        return structure
-    except Exception as e:
-        return [{"error": str(e)}]
-"""
-
-def get_directory_structure(path):
-    """Итеративно получает структуру директории с натуральной сортировкой, игнорируя файлы .db."""
-    path = Path(path)
-    structure = []
-    stack = deque([(path, structure)])
+        with os.scandir(current_path) as it:
+            entries = collator.sort(it, key=lambda x: x.name)
+    except OSError as e:
+        return (prefix, depth, [], [], e.strerror or str(e)), []
+
+    dirs = []
+    files = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            dirs.append(entry)
+            continue
+        name_lower = entry.name.lower()
+        if name_lower.endswith('.db'):
+            continue
+        if not name_lower.endswith(ANALYZED_EXTENSIONS + ARCHIVE_EXTENSIONS):
+            files.append((entry.name, None, None, None))
+            continue
+        # Размер и mtime нужны только анализируемым файлам и архивам (ключ кэша анализа)
+        try:
+            stat = entry.stat()
+            files.append((entry.name, stat.st_size, stat.st_mtime_ns, None))
+        except OSError as e:
+            files.append((entry.name, None, None, e.strerror or str(e)))
+
+    children = []
+    if max_depth is None or depth < max_depth:
+        children = [(entry.path, prefix + entry.name + '/', depth + 1) for entry in dirs]
+    return (prefix, depth, [entry.name for entry in dirs], files, None), children
+
+
+def scan_directory(path, progress=None, collator=None, workers=1, max_depth=None, max_entries=None,
+                   max_in_flight=None):
+    """
+    Однопроходное сканирование директории через os.scandir в компактное дерево NodeTable.
+
+    За один обход строит дерево папок и файлов (без .db; у каждой папки сначала подпапки,
+    затем файлы, в натуральном порядке), список файлов для анализа (PDF, DOCX, XLSX)
+    и список архивов. Тип элемента берётся из кэша DirEntry, без отдельного stat для
+    каждого файла. Ошибки чтения отдельных папок собираются в errors и не прерывают
+    обход остального дерева. files_to_analyze и archives содержат кортежи
+    (относительный путь с разделителем '/', размер, mtime_ns, узел дерева).
+    progress(число найденных файлов), если задан, вызывается после каждой прочитанной папки.
+    Имена каждой папки сортируются один раз здесь (collator — общий Collator запуска);
+    следующие стадии используют порядок детей из дерева без пересортировки.
+
+    При workers > 1 каталоги читаются параллельно пулом WorkStealingLister (для сетевых
+    дисков с большой задержкой), не более max_in_flight чтений одновременно; дерево
+    получается тем же, что и при последовательном обходе. max_depth ограничивает глубину
+    читаемых папок (корень — 0), max_entries — общее число найденных элементов; при
+    срабатывании ограничений в errors добавляется запись с ключом "limit" ("max_depth" или
+    "max_entries"), а обход остального продолжается или (для max_entries) останавливается;
+    папка, на которой сработал max_entries, входит в дерево усечённой до лимита.
+    """
+    collator = collator or Collator()
+    root = Path(path)
+    tree = NodeTable(root.name)
+    files_to_analyze = []
+    archives = []
+    errors = []
+    files_discovered = 0
+    entries_discovered = 0
+    nodes = {"": 0}
+
+    list_task = partial(_list_directory, collator=collator, max_depth=max_depth)
+    root_task = (str(root), "", 0)
+    if workers > 1:
+        listings = WorkStealingLister(list_task, workers, max_in_flight).run(root_task)
+    else:
+        listings = serial_listings(list_task, root_task)
 
     try:
-        while stack:
-            current_path, current_structure = stack.pop()
-            items = natsorted(current_path.iterdir(), key=lambda x: x.name, alg=ns.LOCALE)
-            for item in items:
-                if item.is_dir():
-                    sub_structure = []
-                    current_structure.append({item.name: sub_structure})
-                    stack.append((item, sub_structure))
-                elif item.suffix.lower() != '.db':
-                    current_structure.append(item.name)
-    except PermissionError:
-        structure.append({"error": "Permission denied"})
-    except Exception as e:
-        structure.append({"error": str(e)})
-
-    return structure
\ No newline at end of file
+        for prefix, depth, dirs, files, error in listings:
+            node = nodes.pop(prefix)
+            if error:
+                errors.append({"path": prefix.rstrip('/') or ".", "error": error})
+                continue
+            limit_reached = max_entries is not None and entries_discovered + len(dirs) + len(files) > max_entries
+            if limit_reached:
+                # Папка, на которой сработал лимит, добавляется усечённой до оставшегося числа элементов
+                allowed = max_entries - entries_discovered
+                dirs, files = dirs[:allowed], files[:max(0, allowed - len(dirs))]
+                errors.append({"path": prefix.rstrip('/') or ".", "limit": "max_entries",
+                               "error": f"Превышен лимит числа элементов ({max_entries}), обход остановлен"})
+            entries_discovered += len(dirs) + len(files)
+
+            first = tree.add_children(node, [(name, FOLDER) for name in dirs] +
+                                      [(name, file_kind(name)) for name, _, _, _ in files])
+            for offset, name in enumerate(dirs):
+                if limit_reached:
+                    continue
+                if max_depth is None or depth < max_depth:
+                    nodes[prefix + name + '/'] = first + offset
+                else:
+                    errors.append({"path": prefix + name, "limit": "max_depth",
+                                   "error": f"Папка не прочитана: превышена глубина {max_depth}"})
+
+            first += len(dirs)
+            for offset, (name, size, mtime_ns, stat_error) in enumerate(files):
+                relative_path = prefix + name
+                if stat_error:
+                    errors.append({"path": relative_path, "error": stat_error})
+                elif size is not None:
+                    target = archives if name.lower().endswith(ARCHIVE_EXTENSIONS) else files_to_analyze
+                    target.append((relative_path, size, mtime_ns, first + offset))
+            files_discovered += len(files)
+            if progress:
+                progress(files_discovered)
+            if limit_reached:
+                break
+    finally:
+        listings.close()
+
+    return {
+        "tree": tree,
+        "files_to_analyze": files_to_analyze,
+        "archives": archives,
+        "errors": errors,
+    }
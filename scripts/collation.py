@@ -0,0 +1,48 @@
+import os
+import threading
+import time
+from functools import lru_cache
+from natsort import natsort_keygen, ns
+
+# Сколько ключей сортировки имён хранится в памяти за один запуск
+COLLATION_CACHE_SIZE = int(os.environ.get('COLLATION_CACHE_SIZE', 100000))
+
+
+class Collator:
+    """
+    Натуральная сортировка имён с учётом локали (как natsorted(..., alg=ns.LOCALE)).
+
+    Ключ каждого имени вычисляется один раз и хранится в ограниченном кэше LRU, поэтому
+    повторяющиеся имена («1.pdf», «Том 1») в разных папках не пересчитываются. Создаётся
+    на один запуск инвентаризации; stats() сообщает число вычисленных ключей, попаданий
+    в кэш и суммарное время сортировки.
+    """
+
+    def __init__(self, max_entries=COLLATION_CACHE_SIZE):
+        self.key = lru_cache(maxsize=max_entries)(natsort_keygen(alg=ns.LOCALE))
+        self.seconds = 0.0
+        self.sorts = 0
+        self._lock = threading.Lock()
+
+    def sort(self, items, key=None):
+        """Возвращает новый список items в натуральном порядке; key(item) — сортируемое имя."""
+        start = time.perf_counter()
+        if key is None:
+            result = sorted(items, key=self.key)
+        else:
+            collation_key = self.key
+            result = sorted(items, key=lambda item: collation_key(key(item)))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.seconds += elapsed
+            self.sorts += 1
+        return result
+
+    def stats(self):
+        info = self.key.cache_info()
+        return {
+            "sorts": self.sorts,
+            "keys_computed": info.misses,
+            "cache_hits": info.hits,
+            "seconds": round(self.seconds, 3),
+        }
@@ -0,0 +1,124 @@
+import csv
+import json
+import logging
+import os
+from collections import defaultdict
+from scripts.sheet_writer import SHEET_HEADER, iter_hierarchy_rows, row_color, row_values
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('ndjson', 'csv', 'xlsx')
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def row_record(row):
+    """Запись NDJSON для строки иерархии."""
+    item, level, pages, size, _, _, is_separator, is_folder, is_archive = row
+    if is_separator:
+        kind = "separator"
+    elif is_folder:
+        kind = "folder"
+    else:
+        kind = "archive" if is_archive else "file"
+    return {"name": item, "level": level, "type": kind, "pages": pages if pages != "" else None, "size": size}
+
+
+def _write_ndjson(rows, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row_record(row), ensure_ascii=False))
+            f.write('\n')
+
+
+def _write_csv(rows, path):
+    # utf-8-sig и ';' — чтобы файл корректно открывался в Excel с русской локалью
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(SHEET_HEADER)
+        for row in rows:
+            writer.writerow(row_values(row))
+
+
+def _write_xlsx(rows, path):
+    """XLSX в режиме write-only: строки сбрасываются на диск по мере записи, книга не держится в памяти."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Иерархия")
+    header = []
+    for value in SHEET_HEADER:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+
+    fills = {}
+    for row in rows:
+        values = row_values(row)
+        color = row_color(row)
+        if color is None:
+            sheet.append(values)
+            continue
+        if color not in fills:
+            rgb = ''.join(f"{round(component * 255):02X}" for component in color)
+            fills[color] = PatternFill(fill_type='solid', start_color=rgb, end_color=rgb)
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.fill = fills[color]
+            cells.append(cell)
+        sheet.append(cells)
+    workbook.save(path)
+
+
+_WRITERS = {'ndjson': _write_ndjson, 'csv': _write_csv, 'xlsx': _write_xlsx}
+
+
+def export_hierarchy(tree, path, export_format):
+    """
+    Потоково выгружает иерархию дерева NodeTable в файл NDJSON, CSV или XLSX.
+
+    Строки берутся из того же итеративного обхода, что и для Google Sheets, и пишутся
+    сразу по мере обхода, поэтому память не растёт с размером дерева. Файл сначала
+    пишется во временный <path>.part и переименовывается после успешной записи.
+    Возвращает число выгруженных строк (без заголовка).
+    """
+    if export_format not in _WRITERS:
+        raise ValueError(f"Неизвестный формат выгрузки: {export_format}")
+    stats = {'folders': 0, 'files': defaultdict(int), 'max_level': 0}
+    row_count = 0
+
+    def counted(rows):
+        nonlocal row_count
+        for row in rows:
+            row_count += 1
+            yield row
+
+    temp_path = f"{path}.part"
+    try:
+        _WRITERS[export_format](counted(iter_hierarchy_rows(tree, stats)), temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    logger.info(f"Иерархия выгружена в {path}: {row_count} строк, {stats['folders']} папок")
+    return row_count
+
+
+def prune_exports(folder, keep):
+    """Удаляет самые старые файлы выгрузки в folder, оставляя не более keep последних."""
+    try:
+        entries = sorted(os.scandir(folder), key=lambda entry: entry.stat().st_mtime)
+    except FileNotFoundError:
+        return
+    for entry in entries[:max(0, len(entries) - keep)]:
+        try:
+            os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить выгрузку {entry.path}: {e}")
@@ -0,0 +1,234 @@
+import logging
+import os.path
+import time
+from functools import partial
+from scripts.archive_struct import scan_directory, get_archive_structure, DEFAULT_ARCHIVE_BYTE_BUDGET
+from scripts.analysis_utils import analyze_file
+from scripts.collation import Collator
+from scripts.export import export_hierarchy
+from scripts.jobs import Job, JobCancelled
+from scripts.metrics import REGISTRY, RunMetrics
+from scripts.sheet_writer import write_hierarchy_to_sheet
+from scripts.tree_model import FOLDER
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryError(Exception):
+    """Ошибка входных данных инвентаризации (папка недоступна и т.п.)."""
+
+
+def scan_root(server_path_obj, scan_options=None, job=None, run_metrics=None):
+    """
+    Стадия сканирования: результат scan_directory (дерево, файлы для анализа, архивы, ошибки)
+    и статистика сортировки в "collation". Если корневая папка не читается — InventoryError.
+    scan_options — параметры scan_directory (workers, max_depth, max_entries, max_in_flight).
+    Время и счётчики стадий scan и sort записываются в run_metrics.
+    """
+    job = job or Job()
+    run_metrics = run_metrics or RunMetrics()
+
+    # Получаем дерево папки и списки файлов за один обход
+    def on_scan_progress(files_discovered):
+        job.update(files_discovered=files_discovered)
+        job.check_cancelled()
+
+    job.update(stage='scan')
+    collator = Collator()
+    with run_metrics.stage('scan'):
+        scan_result = scan_directory(server_path_obj, progress=on_scan_progress, collator=collator, **(scan_options or {}))
+    tree = scan_result["tree"]
+    scan_errors = scan_result["errors"]
+    run_metrics.record('scan', entries=len(tree) - 1, files=len(tree) - tree.kind.count(FOLDER),
+                       errors=len(scan_errors))
+    # Фатальна только ошибка чтения самого корня; сработавшие на корне лимиты обхода — нет
+    root_error = next((e for e in scan_errors if e["path"] == "." and "limit" not in e), None)
+    if root_error:
+        raise InventoryError(root_error["error"])
+    for scan_error in scan_errors:
+        if "limit" in scan_error:
+            logger.warning(f"Ограничение обхода в {scan_error['path']}: {scan_error['error']}")
+        else:
+            logger.warning(f"Не удалось прочитать папку {scan_error['path']}: {scan_error['error']}")
+    collation_stats = collator.stats()
+    run_metrics.record('sort', collator.seconds, sorts=collation_stats["sorts"],
+                       keys_computed=collation_stats["keys_computed"], cache_hits=collation_stats["cache_hits"])
+    logger.info(f"Сканирование завершено: {len(tree)} узлов, {len(tree.names)} уникальных имён; "
+                f"сортировка: {collation_stats['keys_computed']} ключей, {collation_stats['cache_hits']} "
+                f"попаданий в кэш, {collation_stats['seconds']} с")
+    scan_result["collation"] = collation_stats
+    return scan_result
+
+
+def analyze_root(server_path_obj, scan_result, analysis_cache, analysis_executor,
+                 archive_expansion=True, archive_byte_budget=DEFAULT_ARCHIVE_BYTE_BUDGET, job=None, run_metrics=None):
+    """
+    Стадии анализа и чтения архивов: метрики файлов и листинги архивов записываются в узлы
+    дерева scan_result["tree"], актуальные результаты берутся из кэша, новые — сохраняются в нём.
+    В run_metrics записываются время стадий analysis и archives, число и объём проанализированных
+    файлов, попадания в кэш, ошибки и время анализа каждого файла.
+    Возвращает {"analysis_cache": {"hits", "misses"}, "analysis_errors": [...]}.
+    """
+    job = job or Job()
+    run_metrics = run_metrics or RunMetrics()
+    tree = scan_result["tree"]
+    analysis_start = time.perf_counter()
+
+    # Файлы для анализа (PDF, DOCX, XLSX) уже собраны сканером; актуальные результаты берём из кэша
+    cache_root = str(server_path_obj.resolve())
+    entries = scan_result["files_to_analyze"]
+    cached = analysis_cache.get_many(cache_root, (entry[:3] for entry in entries))
+    cache_stats = {"hits": len(cached), "misses": len(entries) - len(cached)}
+    logger.info(f"Кэш анализа: {cache_stats['hits']} попаданий, {cache_stats['misses']} промахов")
+
+    files_to_analyze = {}
+    for relative_path, file_size, mtime_ns, node in entries:
+        if relative_path in cached:
+            tree.set_metrics(node, cached[relative_path])
+        else:
+            files_to_analyze[server_path_obj / relative_path] = (relative_path, file_size, mtime_ns, node)
+
+    archives = scan_result["archives"] if archive_expansion else []
+    job.update(stage='analysis', files_total=len(entries) + len(archives))
+    job.add_cached(len(cached))
+
+    analysis_errors = []
+    if files_to_analyze:
+        new_cache_items = []
+        for file_path, metrics, error, seconds in analysis_executor.map(analyze_file, files_to_analyze):
+            job.add_analyzed()
+            job.check_cancelled()
+            scan_path, file_size, mtime_ns, node = files_to_analyze[file_path]
+            run_metrics.record_file(scan_path, seconds)
+            if error:
+                # Ошибки анализа не кэшируем, чтобы повторить попытку при следующем запуске
+                analysis_errors.append({"path": scan_path, "error": error})
+                logger.error(f"Ошибка анализа файла {scan_path}: {error}")
+                continue
+            metrics = {"pages": metrics["pages"], "size": metrics["size"]}
+            tree.set_metrics(node, metrics)
+            new_cache_items.append((scan_path, file_size, mtime_ns, metrics))
+            logger.debug(f"Добавлен файл: {scan_path} с {metrics['pages']} страницами")
+        analysis_cache.put_many(cache_root, new_cache_items)
+    run_metrics.record('analysis', time.perf_counter() - analysis_start, files=len(files_to_analyze),
+                       input_bytes=sum(entry[1] for entry in files_to_analyze.values()), cache_hits=len(cached),
+                       errors=len(analysis_errors))
+
+    # Содержимое архивов (ZIP/RAR): из кэша или потоковым чтением без распаковки на диск
+    def add_archive_listing(scan_path, node, listing):
+        tree.add_structure(node, listing["structure"], listing["analysis"])
+        for member_error in listing["errors"]:
+            analysis_errors.append({"path": f"{scan_path}/{member_error['path']}", "error": member_error["error"]})
+
+    if archives:
+        archives_start = time.perf_counter()
+        errors_before = len(analysis_errors)
+        job.update(stage='archives')
+        # Листинг, прочитанный с другим лимитом байт, неполон или избыточен — читаем архив заново
+        cached_archives = {path: listing for path, listing in
+                           analysis_cache.get_many(cache_root, (entry[:3] for entry in archives)).items()
+                           if listing.get("byte_budget") == archive_byte_budget}
+        cache_stats["hits"] += len(cached_archives)
+        cache_stats["misses"] += len(archives) - len(cached_archives)
+        archives_to_inspect = {}
+        for scan_path, file_size, mtime_ns, node in archives:
+            if scan_path in cached_archives:
+                add_archive_listing(scan_path, node, cached_archives[scan_path])
+            else:
+                archives_to_inspect[server_path_obj / scan_path] = (scan_path, file_size, mtime_ns, node)
+        job.add_cached(len(cached_archives))
+
+        new_cache_items = []
+        inspect_archive = partial(get_archive_structure, byte_budget=archive_byte_budget)
+        for archive_path, listing, error, seconds in analysis_executor.map(inspect_archive, archives_to_inspect):
+            job.add_analyzed()
+            job.check_cancelled()
+            scan_path, file_size, mtime_ns, node = archives_to_inspect[archive_path]
+            run_metrics.record_file(scan_path, seconds)
+            if error:
+                analysis_errors.append({"path": scan_path, "error": error})
+                logger.error(f"Ошибка чтения архива {scan_path}: {error}")
+                continue
+            add_archive_listing(scan_path, node, listing)
+            # Листинги с ошибками членов (нет unrar, исчерпан лимит, повреждённые члены) не кэшируем,
+            # чтобы повторить чтение при следующем запуске
+            if not listing["errors"]:
+                new_cache_items.append((scan_path, file_size, mtime_ns, dict(listing, byte_budget=archive_byte_budget)))
+            logger.debug(f"Прочитан архив: {scan_path}, анализировано членов: {len(listing['analysis'])}")
+        analysis_cache.put_many(cache_root, new_cache_items)
+        run_metrics.record('archives', time.perf_counter() - archives_start, files=len(archives_to_inspect),
+                           input_bytes=sum(entry[1] for entry in archives_to_inspect.values()),
+                           cache_hits=len(cached_archives), errors=len(analysis_errors) - errors_before)
+    return {"analysis_cache": cache_stats, "analysis_errors": analysis_errors}
+
+
+def run_inventory(server_path_obj, table_input, analysis_cache, analysis_executor,
+                  archive_expansion=True, archive_byte_budget=DEFAULT_ARCHIVE_BYTE_BUDGET, sync_worksheet=None,
+                  export_format=None, export_path=None, scan_options=None, job=None):
+    """
+    Полный конвейер инвентаризации папки: сканирование, анализ, архивы, выгрузка и запись в Google Sheets.
+
+    Все стадии работают с одним деревом NodeTable: сканер строит его, результаты анализа
+    и листинги архивов записываются в узлы, выгрузка и запись в таблицу разворачивают его в строки.
+    job получает прогресс по стадиям (scan, analysis, archives, export, sheets) и проверяется
+    на отмену между шагами. Если задан export_format, строки иерархии потоково выгружаются
+    в файл export_path (NDJSON, CSV или XLSX). Если задан sync_worksheet, существующий лист
+    с этим названием обновляется построчно, иначе создаётся новый лист.
+    Метрики стадий возвращаются в hierarchy["metrics"] и учитываются в метриках процесса (/metrics).
+    Возвращает словарь ответа: hierarchy, а также message/summary или error для Sheets.
+    """
+    job = job or Job()
+    run_metrics = RunMetrics()
+    status = 'failed'
+    try:
+        result = _run_stages(server_path_obj, table_input, analysis_cache, analysis_executor, archive_expansion,
+                             archive_byte_budget, sync_worksheet, export_format, export_path, scan_options,
+                             job, run_metrics)
+        result["hierarchy"]["metrics"] = run_metrics.as_dict()
+        status = 'failed' if result.get('error') else 'done'
+        return result
+    except JobCancelled:
+        status = 'cancelled'
+        raise
+    finally:
+        REGISTRY.observe(run_metrics, status)
+
+
+def _run_stages(server_path_obj, table_input, analysis_cache, analysis_executor, archive_expansion,
+                archive_byte_budget, sync_worksheet, export_format, export_path, scan_options, job, run_metrics):
+    scan_result = scan_root(server_path_obj, scan_options, job=job, run_metrics=run_metrics)
+    tree = scan_result["tree"]
+    scan_errors = scan_result["errors"]
+    analysis = analyze_root(server_path_obj, scan_result, analysis_cache, analysis_executor,
+                            archive_expansion=archive_expansion, archive_byte_budget=archive_byte_budget, job=job,
+                            run_metrics=run_metrics)
+    cache_stats = analysis["analysis_cache"]
+    analysis_errors = analysis["analysis_errors"]
+
+    job.check_cancelled()
+    hierarchy_result = {"message": "Иерархия обработана", "nodes": len(tree)}
+    hierarchy_result["analysis_cache"] = cache_stats
+    hierarchy_result["collation"] = scan_result["collation"]
+    if scan_errors:
+        hierarchy_result["scan_errors"] = scan_errors
+    if analysis_errors:
+        hierarchy_result["analysis_errors"] = analysis_errors
+    if export_format:
+        job.update(stage='export')
+        with run_metrics.stage('export'):
+            rows = export_hierarchy(tree, export_path, export_format)
+        run_metrics.record('export', rows=rows, bytes=os.path.getsize(export_path))
+        hierarchy_result["export"] = {"format": export_format, "rows": rows, "file": os.path.basename(export_path)}
+        job.check_cancelled()
+    if table_input:
+        job.update(stage='sheets')
+        try:
+            message, summary = write_hierarchy_to_sheet(tree, table_input, sync_worksheet=sync_worksheet,
+                                                        run_metrics=run_metrics)
+            summary["analysis_cache"] = cache_stats
+            return {"hierarchy": hierarchy_result, "message": message, "summary": summary}
+        except Exception as e:
+            logger.error(f"Ошибка записи в Google Sheets: {str(e)}")
+            return {"hierarchy": hierarchy_result, "error": str(e)}
+
+    return {"hierarchy": hierarchy_result}
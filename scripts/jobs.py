@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """Задание отменено пользователем."""
+
+
+class JobQueueFull(Exception):
+    """Очередь заданий заполнена."""
+
+
+class Job:
+    """
+    Состояние фонового задания инвентаризации.
+
+    Поля прогресса обновляются конвейером через update(); каждое изменение увеличивает
+    version и будит ожидающих в wait_for_change() (поток событий SSE).
+    """
+
+    def __init__(self, job_id=None, description=""):
+        self.id = job_id or uuid.uuid4().hex
+        self.description = description
+        self.state = 'queued'
+        self.stage = 'queued'
+        self.files_discovered = 0
+        self.files_total = 0
+        self.files_analyzed = 0
+        self.files_cached = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.analysis_started_at = None
+        self.finished_at = None
+        self.version = 0
+        self._cancel_event = threading.Event()
+        self._condition = threading.Condition()
+
+    def update(self, **fields):
+        with self._condition:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            if fields.get('stage') == 'analysis' and self.analysis_started_at is None:
+                self.analysis_started_at = time.time()
+            self.version += 1
+            self._condition.notify_all()
+
+    def add_analyzed(self, count=1):
+        self.update(files_analyzed=self.files_analyzed + count)
+
+    def add_cached(self, count):
+        """Учитывает файлы, взятые из кэша: они входят в прогресс, но не в скорость анализа."""
+        self.update(files_cached=self.files_cached + count)
+
+    def cancel(self):
+        self._cancel_event.set()
+        self.update()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Вызывается конвейером между шагами; прерывает работу, если запрошена отмена."""
+        if self._cancel_event.is_set():
+            raise JobCancelled("Задание отменено")
+
+    def wait_for_change(self, version, timeout=None):
+        """Ждёт изменения состояния после version. Возвращает (снимок, текущая версия)."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.snapshot(), self.version
+
+    def snapshot(self):
+        now = self.finished_at or time.time()
+        throughput = None
+        eta = None
+        # Скорость и оставшееся время — только по действительно проанализированным файлам
+        if self.analysis_started_at and self.files_analyzed:
+            elapsed = max(now - self.analysis_started_at, 1e-6)
+            throughput = self.files_analyzed / elapsed
+            if self.state not in FINISHED_STATES:
+                eta = max(self.files_total - self.files_cached - self.files_analyzed, 0) / throughput
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "stage": self.stage,
+            "description": self.description,
+            "files_discovered": self.files_discovered,
+            "files_total": self.files_total,
+            "files_analyzed": self.files_analyzed,
+            "files_cached": self.files_cached,
+            "throughput": round(throughput, 2) if throughput is not None else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "elapsed_seconds": round(now - self.started_at, 2) if self.started_at else 0,
+            "cancel_requested": self.cancel_requested,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Очередь фоновых заданий: не более max_running выполняются одновременно,
+    ещё не более max_queued ждут. Завершённые задания хранятся (последние keep_finished)
+    для запроса статуса.
+    """
+
+    def __init__(self, max_running=2, max_queued=10, keep_finished=100):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, description="", **kwargs):
+        """Ставит func(*args, job=job, **kwargs) в очередь. Результат func — словарь для job.result."""
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.state not in FINISHED_STATES)
+            if active >= self.max_running + self.max_queued:
+                raise JobQueueFull(f"Очередь заполнена: {active} заданий в работе и ожидании")
+            job = Job(description=description)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        logger.info(f"Задание {job.id} поставлено в очередь: {description}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def counts(self):
+        """Число хранимых заданий по состоянию (queued, running, done, failed, cancelled)."""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.state] = counts.get(job.state, 0) + 1
+            return counts
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancel_requested:
+            job.update(state='cancelled', stage='cancelled', finished_at=time.time())
+            return
+        job.update(state='running', started_at=time.time())
+        try:
+            result = func(*args, job=job, **kwargs)
+            state = 'failed' if result and result.get('error') else 'done'
+            job.update(state=state, stage='done', result=result, error=(result or {}).get('error'),
+                       finished_at=time.time())
+        except JobCancelled:
+            job.update(state='cancelled', stage='cancelled', finished_at=time.time())
+            logger.info(f"Задание {job.id} отменено")
+        except Exception as e:
+            job.update(state='failed', error=str(e), finished_at=time.time())
+            logger.error(f"Задание {job.id} завершилось с ошибкой: {e}")
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
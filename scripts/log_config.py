@@ -0,0 +1,49 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from pathlib import Path
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Уровень журнала: INFO — сводки стадий, DEBUG — сообщения по каждому файлу
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+_listener = None
+_lock = threading.Lock()
+
+
+def setup_logging(log_file='logs/app.log', level=LOG_LEVEL):
+    """
+    Настраивает журнал процесса один раз: корневой логгер только кладёт записи в очередь,
+    а запись в файл и консоль выполняет отдельный поток (QueueListener), поэтому рабочие
+    потоки не ждут диска и консоли. Повторные вызовы ничего не меняют.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [logging.FileHandler(log_file, encoding='utf-8'), logging.StreamHandler()]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        if hasattr(os, 'register_at_fork'):
+            # В дочернем процессе (пул анализа) потока записи нет — пишем напрямую
+            def use_direct_handlers():
+                root.removeHandler(queue_handler)
+                for handler in handlers:
+                    root.addHandler(handler)
+
+            os.register_at_fork(after_in_child=use_direct_handlers)
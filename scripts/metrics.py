@@ -0,0 +1,171 @@
+import heapq
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Сколько самых медленных файлов анализа сохраняется в метриках запуска
+SLOWEST_FILES_COUNT = int(os.environ.get('SLOWEST_FILES_COUNT', 10))
+# Границы гистограммы времени анализа одного файла, с
+FILE_SECONDS_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 120)
+
+
+class RunMetrics:
+    """
+    Метрики одного запуска инвентаризации по стадиям: scan, sort, analysis, archives, export,
+    flatten, serialize, upload.
+
+    Для каждой стадии хранится суммарное время и счётчики (файлы, байты, вызовы API и т.п.;
+    input_bytes анализа и архивов — суммарный размер входных файлов, а не прочитанные байты:
+    разбор PDF и листинг архивов читают лишь часть файла),
+    для анализа — N самых медленных файлов и гистограмма времени на файл. Время sort —
+    суммарное время сортировок внутри сканирования, оно входит и во время scan.
+    """
+
+    def __init__(self, slowest_count=SLOWEST_FILES_COUNT):
+        self.stages = {}
+        self.slowest_count = slowest_count
+        self.file_buckets = [0] * (len(FILE_SECONDS_BUCKETS) + 1)
+        self.file_seconds = 0.0
+        self.files_timed = 0
+        self._slowest = []
+
+    def record(self, stage, seconds=0.0, **counters):
+        """Добавляет к стадии время и значения счётчиков."""
+        record = self.stages.setdefault(stage, {"seconds": 0.0})
+        record["seconds"] += seconds
+        for name, value in counters.items():
+            record[name] = record.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, stage, **counters):
+        """Замеряет время блока и добавляет его к стадии."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, **counters)
+
+    def record_file(self, path, seconds):
+        """Время анализа одного файла: гистограмма и список самых медленных."""
+        self.file_seconds += seconds
+        self.files_timed += 1
+        index = 0
+        while index < len(FILE_SECONDS_BUCKETS) and seconds > FILE_SECONDS_BUCKETS[index]:
+            index += 1
+        self.file_buckets[index] += 1
+        if len(self._slowest) < self.slowest_count:
+            heapq.heappush(self._slowest, (seconds, str(path)))
+        elif self._slowest and seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (seconds, str(path)))
+
+    def as_dict(self):
+        """Метрики для ответа JSON: стадии со скоростями files/s, bytes/s, input_bytes/s и самые медленные файлы."""
+        stages = {}
+        for name, record in self.stages.items():
+            seconds = record["seconds"]
+            result = dict(record, seconds=round(seconds, 3))
+            for counter in ("files", "bytes", "input_bytes"):
+                if counter in record and seconds > 0:
+                    result[f"{counter}_per_second"] = round(record[counter] / seconds, 1)
+            stages[name] = result
+        return {
+            "stages": stages,
+            "slowest_files": [{"path": path, "seconds": round(seconds, 3)}
+                              for seconds, path in sorted(self._slowest, reverse=True)],
+        }
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Накопительные метрики процесса для эндпоинта /metrics (текстовый формат Prometheus):
+    число запусков по итогу, суммарное время и счётчики стадий, время стадий последнего
+    запуска и гистограмма времени анализа одного файла.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._stage_seconds = {}
+        self._stage_runs = {}
+        self._stage_counters = {}
+        self._last_run = {}
+        self._file_buckets = [0] * (len(FILE_SECONDS_BUCKETS) + 1)
+        self._file_seconds = 0.0
+        self._files_timed = 0
+
+    def observe(self, run_metrics, status):
+        """Учитывает завершённый запуск (status: done, failed, cancelled)."""
+        with self._lock:
+            self._runs[status] = self._runs.get(status, 0) + 1
+            self._last_run = {name: record["seconds"] for name, record in run_metrics.stages.items()}
+            for name, record in run_metrics.stages.items():
+                self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + record["seconds"]
+                self._stage_runs[name] = self._stage_runs.get(name, 0) + 1
+                for counter, value in record.items():
+                    if counter != "seconds":
+                        key = (name, counter)
+                        self._stage_counters[key] = self._stage_counters.get(key, 0) + value
+            for index, count in enumerate(run_metrics.file_buckets):
+                self._file_buckets[index] += count
+            self._file_seconds += run_metrics.file_seconds
+            self._files_timed += run_metrics.files_timed
+
+    def render(self, gauges=None):
+        """
+        Текст для /metrics. gauges — дополнительные показатели на момент запроса:
+        {имя: (описание, [({метка: значение}, число), ...])}.
+        """
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        with self._lock:
+            metric("inventory_runs_total", "counter", "Завершённые запуски инвентаризации по итогу",
+                   (({"status": status}, count) for status, count in sorted(self._runs.items())))
+            metric("inventory_stage_seconds_total", "counter", "Суммарное время стадий, с",
+                   (({"stage": name}, value) for name, value in sorted(self._stage_seconds.items())))
+            metric("inventory_stage_runs_total", "counter", "Число выполнений стадий",
+                   (({"stage": name}, value) for name, value in sorted(self._stage_runs.items())))
+            metric("inventory_stage_counter_total", "counter",
+                   "Счётчики стадий: файлы, байты, ошибки, попадания в кэш, вызовы API",
+                   (({"stage": name, "counter": counter}, value)
+                    for (name, counter), value in sorted(self._stage_counters.items())))
+            metric("inventory_last_run_stage_seconds", "gauge", "Время стадий последнего запуска, с",
+                   (({"stage": name}, value) for name, value in sorted(self._last_run.items())))
+
+            name = "inventory_file_analysis_seconds"
+            lines.append(f"# HELP {name} Время анализа одного файла, с")
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(FILE_SECONDS_BUCKETS + ("+Inf",), self._file_buckets):
+                cumulative += count
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum {_format_value(self._file_seconds)}")
+            lines.append(f"{name}_count {self._files_timed}")
+
+        for name, (help_text, samples) in (gauges or {}).items():
+            metric(name, "gauge", help_text, samples)
+        return "\n".join(lines) + "\n"
+
+
+# Метрики процесса, общие для всех заданий
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,442 @@
+import io
+import logging
+import mmap
+import re
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Лексемы PDF (ISO 32000-1, 7.2–7.3)
+_SKIP = re.compile(rb'(?:[\x00\t\n\x0c\r ]+|%[^\r\n]*)*')
+_NAME = re.compile(rb'/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)')
+_REF = re.compile(rb'(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+R(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])')
+_NUMBER = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+_KEYWORD = re.compile(rb'[A-Za-z]+')
+_OBJ_HEADER = re.compile(rb'[\x00\t\n\x0c\r ]*(\d+)[\x00\t\n\x0c\r ]+(\d+)[\x00\t\n\x0c\r ]+obj')
+_STREAM = re.compile(rb'[\x00\t\n\x0c\r ]*stream(?:\r\n|\n|\r)')
+_XREF_SUBSECTION = re.compile(rb'[\x00\t\n\x0c\r ]*(\d+)[\x00\t\n\x0c\r ]+(\d+)')
+_XREF_ENTRY = re.compile(rb'[\x00\t\n\x0c\r ]*(\d{1,10})[\x00\t\n\x0c\r ]+(\d{1,5})[\x00\t\n\x0c\r ]+([nf])')
+_STARTXREF = re.compile(rb'startxref[\x00\t\n\x0c\r ]+(\d+)')
+
+# Ограничение глубины дерева страниц — защита от циклических ссылок в повреждённых файлах
+_MAX_TREE_DEPTH = 64
+
+
+class PdfMetadataError(Exception):
+    """Файл не удалось разобрать облегчённым парсером."""
+
+
+class FileRange:
+    """Диапазон байт файла, содержащий PDF целиком (например, несжатый член ZIP внутри архива)."""
+
+    __slots__ = ('path', 'start', 'length')
+
+    def __init__(self, path, start, length):
+        self.path = path
+        self.start = start
+        self.length = length
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self.start)
+            return f.read(self.length)
+
+
+class _Ref:
+    __slots__ = ('num',)
+
+    def __init__(self, num):
+        self.num = num
+
+
+def page_orientation(width, height, rotation=0):
+    """Ориентация страницы с учётом /Rotate: альбомный или книжный."""
+    if rotation % 180 == 90:
+        width, height = height, width
+    return "альбомный" if width > height else "книжный"
+
+
+class _PdfReader:
+    """
+    Минимальный разборщик структуры PDF: xref-таблицы и xref-потоки (включая цепочку /Prev
+    и гибридные файлы), объектные потоки и словари дерева страниц. Содержимое страниц не читается.
+    PDF занимает байты [start, end) буфера; смещения из xref отсчитываются от start.
+    """
+
+    def __init__(self, buf, start=0, end=None):
+        self.buf = buf
+        self.start = start
+        self.end = len(buf) if end is None else end
+        self.xref = {}
+        self.trailer = {}
+        self._object_streams = {}
+        self._load_xref_chain()
+
+    # --- Разбор значений ---
+
+    def _parse(self, pos):
+        buf = self.buf
+        pos = _SKIP.match(buf, pos).end()
+        c = buf[pos:pos + 1]
+        if c == b'/':
+            m = _NAME.match(buf, pos)
+            return m.group(1).decode('latin-1'), m.end()
+        if c == b'<':
+            if buf[pos + 1:pos + 2] == b'<':
+                return self._parse_dict(pos + 2)
+            end = buf.find(b'>', pos)
+            if end < 0:
+                raise PdfMetadataError("Незавершённая шестнадцатеричная строка")
+            return bytes(buf[pos + 1:end]), end + 1
+        if c == b'[':
+            items = []
+            pos += 1
+            while True:
+                pos = _SKIP.match(buf, pos).end()
+                if buf[pos:pos + 1] == b']':
+                    return items, pos + 1
+                value, pos = self._parse(pos)
+                items.append(value)
+        if c == b'(':
+            return self._parse_string(pos)
+        m = _REF.match(buf, pos)
+        if m:
+            return _Ref(int(m.group(1))), m.end()
+        m = _NUMBER.match(buf, pos)
+        if m:
+            token = m.group(0)
+            return (float(token) if b'.' in token else int(token)), m.end()
+        m = _KEYWORD.match(buf, pos)
+        if m:
+            keyword = m.group(0)
+            if keyword in (b'true', b'false'):
+                return keyword == b'true', m.end()
+            if keyword == b'null':
+                return None, m.end()
+        raise PdfMetadataError(f"Неожиданная лексема на позиции {pos}")
+
+    def _parse_dict(self, pos):
+        buf = self.buf
+        result = {}
+        while True:
+            pos = _SKIP.match(buf, pos).end()
+            if buf[pos:pos + 2] == b'>>':
+                return result, pos + 2
+            m = _NAME.match(buf, pos)
+            if not m:
+                raise PdfMetadataError(f"Ожидался ключ словаря на позиции {pos}")
+            value, pos = self._parse(m.end())
+            result[m.group(1).decode('latin-1')] = value
+
+    def _parse_string(self, pos):
+        buf = self.buf
+        depth = 0
+        i = pos
+        end = self.end
+        while i < end:
+            c = buf[i]
+            if c == 0x5C:  # '\'
+                i += 2
+                continue
+            if c == 0x28:  # '('
+                depth += 1
+            elif c == 0x29:  # ')'
+                depth -= 1
+                if depth == 0:
+                    return bytes(buf[pos + 1:i]), i + 1
+            i += 1
+        raise PdfMetadataError("Незавершённая строка")
+
+    # --- Таблица перекрёстных ссылок ---
+
+    def _load_xref_chain(self):
+        tail_start = max(self.start, self.end - 2048)
+        matches = list(_STARTXREF.finditer(self.buf, tail_start, self.end))
+        if not matches:
+            raise PdfMetadataError("Не найден startxref")
+        offset = int(matches[-1].group(1))
+        visited = set()
+        while offset is not None and offset not in visited:
+            visited.add(offset)
+            trailer = self._load_xref_section(offset)
+            if isinstance(trailer.get('XRefStm'), int) and trailer['XRefStm'] not in visited:
+                visited.add(trailer['XRefStm'])
+                self._load_xref_section(trailer['XRefStm'])
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            offset = trailer.get('Prev')
+        if 'Root' not in self.trailer:
+            raise PdfMetadataError("В трейлере нет /Root")
+
+    def _load_xref_section(self, offset):
+        buf = self.buf
+        pos = _SKIP.match(buf, self.start + offset).end()
+        if buf[pos:pos + 4] == b'xref':
+            return self._load_xref_table(pos + 4)
+        return self._load_xref_stream(offset)
+
+    def _load_xref_table(self, pos):
+        buf = self.buf
+        while True:
+            pos = _SKIP.match(buf, pos).end()
+            if buf[pos:pos + 7] == b'trailer':
+                trailer, _ = self._parse(pos + 7)
+                return trailer
+            m = _XREF_SUBSECTION.match(buf, pos)
+            if not m:
+                raise PdfMetadataError("Повреждённая таблица xref")
+            start, count = int(m.group(1)), int(m.group(2))
+            pos = m.end()
+            for num in range(start, start + count):
+                entry = _XREF_ENTRY.match(buf, pos)
+                if not entry:
+                    raise PdfMetadataError("Повреждённая запись xref")
+                pos = entry.end()
+                # Свободные записи не сохраняем: в гибридных файлах объект описан в /XRefStm
+                if entry.group(3) == b'n' and num not in self.xref:
+                    self.xref[num] = (1, int(entry.group(1)), 0)
+
+    def _load_xref_stream(self, offset):
+        header = _OBJ_HEADER.match(self.buf, self.start + offset)
+        if not header:
+            raise PdfMetadataError(f"Нет объекта xref-потока на позиции {offset}")
+        stream_dict, data = self._parse_stream_object(header.end())
+        widths = stream_dict['W']
+        index = stream_dict.get('Index', [0, stream_dict['Size']])
+        pos = 0
+        for i in range(0, len(index), 2):
+            start, count = index[i], index[i + 1]
+            for num in range(start, start + count):
+                fields = []
+                for width in widths:
+                    value = 0
+                    for b in data[pos:pos + width]:
+                        value = (value << 8) | b
+                    fields.append(value)
+                    pos += width
+                entry_type = fields[0] if widths[0] else 1
+                if entry_type in (1, 2) and num not in self.xref:
+                    self.xref[num] = (entry_type, fields[1], fields[2])
+        if pos > len(data):
+            raise PdfMetadataError("Xref-поток короче объявленного")
+        return stream_dict
+
+    # --- Объекты и потоки ---
+
+    def _parse_stream_object(self, pos):
+        stream_dict, pos = self._parse(pos)
+        m = _STREAM.match(self.buf, pos)
+        if not isinstance(stream_dict, dict) or not m:
+            raise PdfMetadataError("Ожидался поток")
+        start = m.end()
+        length = self.resolve(stream_dict.get('Length'))
+        if not isinstance(length, int):
+            end = self.buf.find(b'endstream', start, self.end)
+            if end < 0:
+                raise PdfMetadataError("Не найден конец потока")
+            length = end - start
+        return stream_dict, self._decode(stream_dict, self.buf[start:start + length])
+
+    def _decode(self, stream_dict, data):
+        filters = self.resolve(stream_dict.get('Filter'))
+        params = self.resolve(stream_dict.get('DecodeParms'))
+        if filters is None:
+            return data
+        if not isinstance(filters, list):
+            filters, params = [filters], [params]
+        elif not isinstance(params, list):
+            params = [params] * len(filters)
+        for name, param in zip(filters, params):
+            if name not in ('FlateDecode', 'Fl'):
+                raise PdfMetadataError(f"Фильтр {name} не поддерживается")
+            data = zlib.decompress(data)
+            param = self.resolve(param) or {}
+            predictor = param.get('Predictor', 1)
+            if predictor >= 10:
+                bpp = max(1, (param.get('Colors', 1) * param.get('BitsPerComponent', 8)) // 8)
+                row_len = (param.get('Columns', 1) * param.get('Colors', 1) * param.get('BitsPerComponent', 8) + 7) // 8
+                data = _png_unpredict(data, row_len, bpp)
+            elif predictor != 1:
+                raise PdfMetadataError(f"Предиктор {predictor} не поддерживается")
+        return data
+
+    def resolve(self, value):
+        depth = 0
+        while isinstance(value, _Ref):
+            depth += 1
+            if depth > _MAX_TREE_DEPTH:
+                raise PdfMetadataError("Циклическая ссылка")
+            value = self.get_object(value.num)
+        return value
+
+    def get_object(self, num):
+        entry = self.xref.get(num)
+        if entry is None:
+            return None
+        if entry[0] == 1:
+            header = _OBJ_HEADER.match(self.buf, self.start + entry[1])
+            if not header or int(header.group(1)) != num:
+                raise PdfMetadataError(f"Неверное смещение объекта {num}")
+            value, _ = self._parse(header.end())
+            return value
+        stream_num = entry[1]
+        objects = self._object_streams.get(stream_num)
+        if objects is None:
+            objects = self._load_object_stream(stream_num)
+            self._object_streams[stream_num] = objects
+        return objects.get(num)
+
+    def _load_object_stream(self, stream_num):
+        entry = self.xref.get(stream_num)
+        if entry is None or entry[0] != 1:
+            raise PdfMetadataError(f"Объектный поток {stream_num} не найден")
+        header = _OBJ_HEADER.match(self.buf, self.start + entry[1])
+        if not header:
+            raise PdfMetadataError(f"Неверное смещение объектного потока {stream_num}")
+        stream_dict, data = self._parse_stream_object(header.end())
+        first, count = stream_dict['First'], stream_dict['N']
+        stream_reader = _PdfReader.__new__(_PdfReader)
+        stream_reader.buf = bytes(data)
+        stream_reader.start, stream_reader.end = 0, len(stream_reader.buf)
+        numbers = [int(token) for token in stream_reader.buf[:first].split()[:count * 2]]
+        objects = {}
+        for i in range(0, len(numbers), 2):
+            objects[numbers[i]], _ = stream_reader._parse(first + numbers[i + 1])
+        return objects
+
+    # --- Дерево страниц ---
+
+    def page_info(self):
+        """Возвращает (количество страниц, ширина, высота, поворот первой страницы)."""
+        root = self.resolve(self.trailer['Root'])
+        pages = self.resolve(root['Pages'])
+        count = self.resolve(pages.get('Count'))
+        if not isinstance(count, int):
+            raise PdfMetadataError("В дереве страниц нет /Count")
+        node = pages
+        media_box = rotation = None
+        for _ in range(_MAX_TREE_DEPTH):
+            # MediaBox и Rotate наследуются от узлов /Pages (ISO 32000-1, 7.7.3.4)
+            if 'MediaBox' in node:
+                media_box = self.resolve(node['MediaBox'])
+            if 'Rotate' in node:
+                rotation = self.resolve(node['Rotate'])
+            if node.get('Type') == 'Page' or 'Kids' not in node:
+                break
+            kids = self.resolve(node['Kids'])
+            if not kids:
+                break
+            node = self.resolve(kids[0])
+        else:
+            raise PdfMetadataError("Слишком глубокое дерево страниц")
+        if count and not media_box:
+            raise PdfMetadataError("У первой страницы нет /MediaBox")
+        width = height = None
+        if media_box:
+            x0, y0, x1, y1 = (self.resolve(v) for v in media_box)
+            width, height = abs(x1 - x0), abs(y1 - y0)
+        return count, width, height, int(rotation or 0)
+
+
+def _png_unpredict(data, row_len, bpp):
+    """Снимает PNG-предикторы (фильтры 0–4) с распакованных данных потока."""
+    out = bytearray()
+    prev = bytearray(row_len)
+    for i in range(0, len(data), row_len + 1):
+        filter_type = data[i]
+        row = bytearray(data[i + 1:i + 1 + row_len])
+        if filter_type == 1:
+            for j in range(bpp, len(row)):
+                row[j] = (row[j] + row[j - bpp]) & 0xFF
+        elif filter_type == 2:
+            for j in range(len(row)):
+                row[j] = (row[j] + prev[j]) & 0xFF
+        elif filter_type == 3:
+            for j in range(len(row)):
+                left = row[j - bpp] if j >= bpp else 0
+                row[j] = (row[j] + ((left + prev[j]) >> 1)) & 0xFF
+        elif filter_type == 4:
+            for j in range(len(row)):
+                a = row[j - bpp] if j >= bpp else 0
+                b = prev[j]
+                c = prev[j - bpp] if j >= bpp else 0
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                predictor = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                row[j] = (row[j] + predictor) & 0xFF
+        elif filter_type != 0:
+            raise PdfMetadataError(f"Неизвестный PNG-фильтр {filter_type}")
+        out += row
+        prev = row
+    return bytes(out)
+
+
+def _metadata_from_reader(reader):
+    count, width, height, rotation = reader.page_info()
+    if not count:
+        return {"pages": 0, "size": "Error: Unable to get size"}
+    return {"pages": count, "size": page_orientation(width, height, rotation)}
+
+
+def _read_with_pdfplumber(source):
+    import pdfplumber
+
+    with pdfplumber.open(source) as pdf:
+        page_count = len(pdf.pages)
+        if not page_count:
+            return {"pages": 0, "size": "Error: Unable to get size"}
+        page = pdf.pages[0]
+        if page.width is None or page.height is None:
+            return {"pages": page_count, "size": "Error: Unable to get size"}
+        # pdfplumber уже учитывает /Rotate в width/height
+        return {"pages": page_count, "size": page_orientation(page.width, page.height)}
+
+
+def _read_mapped(f, start=0, end=None):
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        return _metadata_from_reader(_PdfReader(buf, start, end))
+
+
+def read_pdf_metadata(source):
+    """
+    Количество страниц и ориентация первой страницы PDF за одно открытие файла.
+
+    source — путь к файлу, FileRange, байты или файловый объект (например, член архива).
+    Файл отображается в память, читаются только трейлер, xref и словари дерева страниц
+    (/Count, /MediaBox, /Rotate первой страницы); файловый объект без дескриптора
+    читается в память. Если файл повреждён или использует неподдерживаемые возможности,
+    выполняется откат на pdfplumber.
+    Возвращает {"pages": int, "size": "альбомный" | "книжный"}.
+    """
+    if isinstance(source, FileRange):
+        try:
+            with open(source.path, 'rb') as f:
+                return _read_mapped(f, source.start, source.start + source.length)
+        except Exception as e:
+            logger.debug(f"Облегчённый разбор {source.path} (с байта {source.start}) не удался ({e}), используется pdfplumber")
+        return _read_with_pdfplumber(io.BytesIO(source.read()))
+    if hasattr(source, 'read'):
+        try:
+            source.fileno()
+        except (AttributeError, OSError):
+            source = source.read()
+        else:
+            try:
+                return _read_mapped(source)
+            except Exception as e:
+                logger.debug(f"Облегчённый разбор файлового объекта не удался ({e}), используется pdfplumber")
+            source.seek(0)
+            return _read_with_pdfplumber(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        try:
+            return _metadata_from_reader(_PdfReader(source))
+        except Exception as e:
+            logger.debug(f"Облегчённый разбор PDF не удался ({e}), используется pdfplumber")
+            return _read_with_pdfplumber(io.BytesIO(source))
+
+    with open(source, 'rb') as f:
+        try:
+            return _read_mapped(f)
+        except Exception as e:
+            logger.debug(f"Облегчённый разбор {source} не удался ({e}), используется pdfplumber")
+    return _read_with_pdfplumber(source)
@@ -1,59 +1,179 @@
-import json
-import gspread
 import logging
 from collections import defaultdict
-import os.path
+from difflib import SequenceMatcher
+import os
+import random
+import re
+import threading
+from urllib.parse import quote
 from datetime import datetime
 import time
-from natsort import natsorted, ns
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+from scripts.metrics import RunMetrics
+from scripts.tree_model import ARCHIVE, FOLDER
+
 logger = logging.getLogger(__name__)
 
-order_table = gspread.service_account(filename='credentials/snappy-stacker-431017-p0-08d715145a62.json')
-
-def flatten_hierarchy(folders, result=None, level=1, stats=None, pdf_analysis_data=None, current_path=""):
-    if result is None:
-        result = []
-    if stats is None:
-        stats = {'folders': 0, 'files': defaultdict(int), 'max_level': 0}
-    if pdf_analysis_data is None:
-        pdf_analysis_data = {}
-
-    for item in folders:
-        if isinstance(item, dict):
-            for folder_name, content in item.items():
-                result.append((folder_name, level, "", "", "", "", False, True, False))  # Папка
-                stats['folders'] += 1
-                stats['max_level'] = max(stats['max_level'], level)
-                sub_path = os.path.join(current_path, folder_name).replace('\\', '/')
-                sub_folders = natsorted([sub_item for sub_item in content if isinstance(sub_item, dict)],
-                                        key=lambda x: list(x.keys())[0], alg=ns.LOCALE)
-                sub_files = natsorted([sub_item for sub_item in content if isinstance(sub_item, str)], alg=ns.LOCALE)
-                flatten_hierarchy(sub_folders, result, level + 1, stats, pdf_analysis_data, sub_path)
-                if sub_folders and sub_files:
-                    result.append(("", level, "", "", "", "", True, False, False))  # Пустая строка
-                for file in sub_files:
-                    file_normalized = os.path.normpath(os.path.join(sub_path, file)).replace('\\', '/')
-                    analysis = pdf_analysis_data.get(file_normalized, {})
-                    pages = analysis.get('pages', "") if file.lower().endswith('.pdf') else ""
-                    size = analysis.get('size', "")
-                    orientation = analysis.get('orientation', "")
-                    char_count = analysis.get('char_count', "")
-                    is_archive = file.lower().endswith(('.rar', '.zip'))
-                    logger.info(f"Обработка файла: {file_normalized}, страницы: {pages}, ориентация страницы: {size}, ориентация текста: {orientation}, символы: {char_count}, архив: {is_archive}")
-                    result.append((file, level + 1, pages, size, orientation, char_count, False, False, is_archive))  # Файл
-                    _, ext = os.path.splitext(file.lower())
-                    stats['files'][ext or 'no_extension'] += 1
-    return result, stats
+# Ключ сервисного аккаунта читается только при первой записи в Google Sheets
+GOOGLE_SERVICE_ACCOUNT_FILE = os.environ.get('GOOGLE_SERVICE_ACCOUNT_FILE',
+                                             'credentials/snappy-stacker-431017-p0-08d715145a62.json')
+# Соединений keep-alive в пуле HTTP-сессии, общей для всех заданий
+SHEETS_HTTP_POOL_SIZE = int(os.environ.get('SHEETS_HTTP_POOL_SIZE', 10))
+SHEETS_API_BASE_URL = os.environ.get('SHEETS_API_BASE_URL', 'https://sheets.googleapis.com/v4/spreadsheets')
+# Строк в одном вызове values.batchUpdate: крупнее — меньше вызовов, мельче — меньше тело запроса
+VALUES_CHUNK_ROWS = int(os.environ.get('SHEETS_VALUES_CHUNK_ROWS', 5000))
+SHEET_COLUMNS = 7
+SHEET_HEADER = ("Имя", "Уровень", "Кол-во страниц (листов для XLSX)", "Ориентация страницы")
+ARCHIVE_COLOR = (1.0, 1.0, 0.0)
+WHITE_COLOR = (1.0, 1.0, 1.0)
+SPREADSHEET_URL_RE = re.compile(r'/spreadsheets/d/([a-zA-Z0-9-_]+)')
+
+_client = None
+_client_lock = threading.Lock()
+
+class SpreadsheetNotFound(Exception):
+    """Таблица не найдена по URL или названию."""
+
+def get_sheets_client():
+    """
+    Общий клиент gspread: создаётся при первом вызове и переиспользуется всеми потоками.
+
+    gspread импортируется здесь же, чтобы запуск приложения и сканирование без записи
+    в таблицы не зависели от ключа и библиотек Google. Сессия клиента (AuthorizedSession)
+    сама обновляет токен доступа; ей подключается пул соединений размером SHEETS_HTTP_POOL_SIZE.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import gspread
+                from requests.adapters import HTTPAdapter
+                client = gspread.service_account(filename=GOOGLE_SERVICE_ACCOUNT_FILE)
+                adapter = HTTPAdapter(pool_connections=SHEETS_HTTP_POOL_SIZE, pool_maxsize=SHEETS_HTTP_POOL_SIZE)
+                client.http_client.session.mount('https://', adapter)
+                client.http_client.session.mount('http://', adapter)
+                _client = client
+                logger.info(f"Клиент Google Sheets создан: {GOOGLE_SERVICE_ACCOUNT_FILE}")
+    return _client
+
+def iter_hierarchy_rows(tree, stats):
+    """
+    Итеративно разворачивает дерево NodeTable в строки листа в порядке вывода.
+
+    Строка — кортеж (имя, уровень, страницы, формат, ориентация текста, символы,
+    разделитель, папка, архив). Папки верхнего уровня и корневые файлы имеют уровень 1;
+    содержимое папки — уровнем ниже, подпапки отделяются от файлов пустой строкой;
+    содержимое архива разворачивается сразу под ним. Порядок детей берётся из дерева
+    как есть, пути файлов не собираются. stats пополняется счётчиками папок и расширений.
+    """
+    # Элемент стека: (тип строки, узел, уровень); тип None — пустая строка-разделитель
+    stack = []
+
+    def push_contents(node, child_level, separator_level, separator_always=False):
+        items = []
+        has_folders = False
+        for child in tree.children(node):
+            if tree.kind[child] == FOLDER:
+                has_folders = True
+            elif has_folders or separator_always:
+                items.append((None, node, separator_level))
+                has_folders = separator_always = False
+            items.append((tree.kind[child], child, child_level))
+        stack.extend(reversed(items))
+
+    push_contents(0, 1, 1, separator_always=True)
+    while stack:
+        kind, node, level = stack.pop()
+        if kind is None:
+            yield ("", level, "", "", "", "", True, False, False)
+        elif kind == FOLDER:
+            stats['folders'] += 1
+            stats['max_level'] = max(stats['max_level'], level)
+            yield (tree.name(node), level, "", "", "", "", False, True, False)
+            push_contents(node, level + 1, level)
+        else:
+            name = tree.name(node)
+            _, ext = os.path.splitext(name.lower())
+            stats['files'][ext or 'no_extension'] += 1
+            if level == 1:
+                stats['max_level'] = max(stats['max_level'], 1)
+            metrics = tree.metrics(node)
+            yield (name, level, metrics["pages"], metrics["size"], "", "", False, False, kind == ARCHIVE)
+            if kind == ARCHIVE:
+                push_contents(node, level + 1, level)
+
+def flatten_tree(tree):
+    """Строки листа для всего дерева и статистика {'folders', 'files', 'max_level'}."""
+    stats = {'folders': 0, 'files': defaultdict(int), 'max_level': 0}
+    return list(iter_hierarchy_rows(tree, stats)), stats
+
+class SheetsApiError(Exception):
+    """Ошибка ответа Google Sheets API."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"Sheets API {status_code}: {message}")
+        self.status_code = status_code
+
+
+class SheetsApi:
+    """
+    Минимальный клиент Google Sheets REST API v4 поверх авторизованной HTTP-сессии.
+
+    Повторяет запросы при 429/5xx и сетевых ошибках с экспоненциальной задержкой
+    (учитывая Retry-After) и считает выполненные вызовы. base_url можно направить
+    на локальный поддельный сервер Sheets для проверок и бенчмарков.
+    """
+
+    def __init__(self, session, base_url=None, max_retries=6, backoff_base=1.0, max_backoff=64.0):
+        self.session = session
+        self.base_url = (base_url or SHEETS_API_BASE_URL).rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.calls = 0
+        self.retries = 0
+
+    def request(self, method, path, **kwargs):
+        url = f"{self.base_url}/{path}"
+        for attempt in range(self.max_retries + 1):
+            self.calls += 1
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except OSError as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = None
+                logger.warning(f"Сетевая ошибка Sheets API: {e}")
+            else:
+                if response.status_code < 400:
+                    return response.json() if response.content else {}
+                if (response.status_code != 429 and response.status_code < 500) or attempt == self.max_retries:
+                    raise SheetsApiError(response.status_code, response.text[:500])
+                retry_after = response.headers.get('Retry-After')
+                logger.warning(f"Sheets API вернул {response.status_code}, повтор {attempt + 1} из {self.max_retries}")
+            self.retries += 1
+            delay = min(self.max_backoff, self.backoff_base * 2 ** attempt) + random.uniform(0, self.backoff_base)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            time.sleep(delay)
+
+    def batch_update(self, spreadsheet_id, requests):
+        return self.request('POST', f"{spreadsheet_id}:batchUpdate", json={"requests": requests})
+
+    def values_batch_update(self, spreadsheet_id, data, value_input_option="RAW"):
+        return self.request('POST', f"{spreadsheet_id}/values:batchUpdate",
+                            json={"valueInputOption": value_input_option, "data": data})
+
+    def values_get(self, spreadsheet_id, range_name):
+        return self.request('GET', f"{spreadsheet_id}/values/{quote(range_name)}")
+
+    def get_sheet_id(self, spreadsheet_id, title):
+        """sheetId листа с названием title или None, если такого листа нет."""
+        metadata = self.request('GET', spreadsheet_id, params={"fields": "sheets.properties(sheetId,title)"})
+        for sheet in metadata.get('sheets', []):
+            if sheet['properties']['title'] == title:
+                return sheet['properties']['sheetId']
+        return None
+
 
 def get_color_for_level(level):
     colors = [
@@ -63,101 +183,276 @@ def get_color_for_level(level):
     ]
     return colors[min(level, len(colors) - 1)]
 
-def write_hierarchy_to_sheet(json_file_path, table_input):
+def build_format_requests(sheet_id, flat_data, columns=SHEET_COLUMNS):
+    """
+    Запросы repeatCell для фона строк: заголовок, папки/разделители по уровням и архивы.
+    Подряд идущие строки с одинаковым цветом объединяются в один диапазон.
+    """
+    requests = [{
+        "repeatCell": {
+            "range": {"sheetId": sheet_id, "startRowIndex": 0, "endRowIndex": 1, "startColumnIndex": 0, "endColumnIndex": columns},
+            "cell": {"userEnteredFormat": {
+                "textFormat": {"bold": True},
+                "backgroundColor": {"red": 0.7, "green": 0.7, "blue": 0.7}
+            }},
+            "fields": "userEnteredFormat(textFormat,backgroundColor)"
+        }
+    }]
+
+    def add_block(color, start, end):
+        requests.append(repeat_background(sheet_id, start, end, color, columns))
+
+    block_color = None
+    block_start = 0
+    # Строка 0 — заголовок, данные начинаются с индекса 1
+    for idx, row in enumerate(flat_data, start=1):
+        color = row_color(row)
+        if color != block_color:
+            if block_color is not None:
+                add_block(block_color, block_start, idx)
+            block_color, block_start = color, idx
+    if block_color is not None:
+        add_block(block_color, block_start, len(flat_data) + 1)
+    return requests
+
+def row_color(row):
+    """Цвет фона строки иерархии: архивы, папки и разделители по уровню; None — без заливки."""
+    _, level, _, _, _, _, is_separator, is_folder, is_archive = row
+    if is_archive:
+        return ARCHIVE_COLOR
+    if is_separator or is_folder:
+        return tuple(get_color_for_level(level))
+    return None
+
+def repeat_background(sheet_id, start, end, color, columns=SHEET_COLUMNS):
+    """Запрос repeatCell: фон строк [start, end) листа."""
+    return {
+        "repeatCell": {
+            "range": {"sheetId": sheet_id, "startRowIndex": start, "endRowIndex": end, "startColumnIndex": 0, "endColumnIndex": columns},
+            "cell": {"userEnteredFormat": {"backgroundColor": {"red": color[0], "green": color[1], "blue": color[2]}}},
+            "fields": "userEnteredFormat.backgroundColor"
+        }
+    }
+
+def row_values(row):
+    """Ячейки строки листа для элемента иерархии (отступ имени по уровню)."""
+    item, level, pages, size, orientation, char_count, is_separator, _, is_archive = row
+    translation_stats = ""
+    return [f"{'  ' * level}{item}", str(level) if not is_separator else "", str(pages), size, orientation, char_count, translation_stats]
+
+def build_values(flat_data):
+    """Строки листа: заголовок и по строке на каждый элемент иерархии."""
+    values = [list(SHEET_HEADER)]
+    values.extend(row_values(row) for row in flat_data)
+    return values
+
+def a1_range(title, start_row, end_row, columns=SHEET_COLUMNS):
+    """A1-диапазон строк start_row..end_row (с 1) на листе title."""
+    last_column = chr(ord('A') + columns - 1)
+    escaped_title = title.replace("'", "''")
+    return f"'{escaped_title}'!A{start_row}:{last_column}{end_row}"
+
+def upload_values(api, spreadsheet_id, title, values, start_row=1, chunk_rows=None):
+    """Загружает значения кусками по chunk_rows строк, по одному вызову values.batchUpdate на кусок."""
+    chunk_rows = chunk_rows or VALUES_CHUNK_ROWS
+    for offset in range(0, len(values), chunk_rows):
+        chunk = values[offset:offset + chunk_rows]
+        first_row = start_row + offset
+        api.values_batch_update(spreadsheet_id, [{
+            "range": a1_range(title, first_row, first_row + len(chunk) - 1),
+            "values": chunk
+        }])
+
+def open_spreadsheet_id(table_input, api):
+    """ID таблицы по URL (без обращения к API) или по названию (поиск через Drive)."""
+    if table_input.startswith('http'):
+        match = SPREADSHEET_URL_RE.search(table_input)
+        if not match:
+            raise SpreadsheetNotFound(table_input)
+        return match.group(1)
+    import gspread
+    api.calls += 1
+    try:
+        return get_sheets_client().open(table_input).id
+    except gspread.SpreadsheetNotFound:
+        raise SpreadsheetNotFound(table_input)
+
+def write_new_sheet(api, spreadsheet_id, title, values, flat_data):
+    """Создаёт лист точного размера с форматированием (один batchUpdate) и загружает значения."""
+    sheet_id = random.randint(1, 2 ** 31 - 1)
+    requests = [{
+        "addSheet": {"properties": {
+            "sheetId": sheet_id,
+            "title": title,
+            "gridProperties": {"rowCount": len(values), "columnCount": SHEET_COLUMNS}
+        }}
+    }]
+    requests.extend(build_format_requests(sheet_id, flat_data))
+    api.batch_update(spreadsheet_id, requests)
+    upload_values(api, spreadsheet_id, title, values)
+
+def _contiguous_blocks(indexes):
+    """Разбивает отсортированные индексы на полуинтервалы [start, end) подряд идущих значений."""
+    blocks = []
+    for index in indexes:
+        if blocks and blocks[-1][1] == index:
+            blocks[-1][1] = index + 1
+        else:
+            blocks.append([index, index + 1])
+    return blocks
+
+def sync_sheet(api, spreadsheet_id, title, values, flat_data):
+    """
+    Приводит существующий лист к новым значениям минимальным набором изменений.
+
+    Строки сопоставляются по имени (с отступом) и уровню; совпавшие строки с другими
+    страницами/ориентацией перезаписываются, лишние удаляются, новые вставляются.
+    Вставки и удаления вместе с форматированием новых строк уходят одним batchUpdate,
+    значения — одним values.batchUpdate на VALUES_CHUNK_ROWS строк.
+    Возвращает статистику изменений или None, если листа title нет.
+    """
+    sheet_id = api.get_sheet_id(spreadsheet_id, title)
+    if sheet_id is None:
+        return None
+
+    escaped_title = title.replace("'", "''")
+    current = api.values_get(spreadsheet_id, f"'{escaped_title}'!A:{chr(ord('A') + SHEET_COLUMNS - 1)}")
+
+    def normalize(row):
+        row = [str(cell) for cell in row[:SHEET_COLUMNS]]
+        return row + [""] * (SHEET_COLUMNS - len(row))
+
+    old_rows = [normalize(row) for row in current.get('values', [])]
+    new_rows = [normalize(row) for row in values]
+    matcher = SequenceMatcher(None, [tuple(row[:2]) for row in old_rows], [tuple(row[:2]) for row in new_rows])
+
+    structural_requests = []
+    value_rows = []
+    format_rows = []
+    stats = {"inserted": 0, "deleted": 0, "updated": 0}
+    # С конца листа, чтобы индексы ещё не обработанных строк не сдвигались
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            changed = [j1 + k for k in range(i2 - i1) if old_rows[i1 + k] != new_rows[j1 + k]]
+            value_rows.extend(changed)
+            stats["updated"] += len(changed)
+            continue
+        common = min(i2 - i1, j2 - j1)
+        value_rows.extend(range(j1, j1 + common))
+        format_rows.extend(range(j1, j1 + common))
+        stats["updated"] += common
+        if i2 - i1 > common:
+            structural_requests.append({"deleteDimension": {"range": {
+                "sheetId": sheet_id, "dimension": "ROWS", "startIndex": i1 + common, "endIndex": i2
+            }}})
+            stats["deleted"] += i2 - i1 - common
+        elif j2 - j1 > common:
+            structural_requests.append({"insertDimension": {"range": {
+                "sheetId": sheet_id, "dimension": "ROWS", "startIndex": i1 + common, "endIndex": i1 + j2 - j1
+            }, "inheritFromBefore": False}})
+            value_rows.extend(range(j1 + common, j2))
+            format_rows.extend(range(j1 + common, j2))
+            stats["inserted"] += j2 - j1 - common
+
+    # Фон строк, которые заняли новые элементы; строка 0 — заголовок
+    format_requests = []
+    for start, end in _contiguous_blocks(sorted(row for row in format_rows if row > 0)):
+        block_start = start
+        block_color = row_color(flat_data[start - 1]) or WHITE_COLOR
+        for index in range(start + 1, end):
+            color = row_color(flat_data[index - 1]) or WHITE_COLOR
+            if color != block_color:
+                format_requests.append(repeat_background(sheet_id, block_start, index, block_color))
+                block_start, block_color = index, color
+        format_requests.append(repeat_background(sheet_id, block_start, end, block_color))
+
+    if structural_requests or format_requests:
+        api.batch_update(spreadsheet_id, structural_requests + format_requests)
+
+    data = []
+    rows_in_call = 0
+    for start, end in _contiguous_blocks(sorted(value_rows)):
+        data.append({"range": a1_range(title, start + 1, end), "values": values[start:end]})
+        rows_in_call += end - start
+        if rows_in_call >= VALUES_CHUNK_ROWS:
+            api.values_batch_update(spreadsheet_id, data)
+            data, rows_in_call = [], 0
+    if data:
+        api.values_batch_update(spreadsheet_id, data)
+    return stats
+
+def write_hierarchy_to_sheet(tree, table_input, api=None, sync_worksheet=None, run_metrics=None):
+    """
+    Записывает иерархию из дерева NodeTable в таблицу: в новый лист Иерархия_<время> или, если задан
+    sync_worksheet, синхронизирует существующий лист с этим названием (создаёт его при отсутствии).
+    Время стадий flatten (строки из дерева), serialize (значения ячеек) и upload (вызовы API)
+    записывается в run_metrics.
+    """
     start_time = time.time()
+    run_metrics = run_metrics or RunMetrics()
+    api = api or SheetsApi(get_sheets_client().http_client.session)
     try:
-        spreadsheet = order_table.open_by_url(table_input) if table_input.startswith('http') else order_table.open(
-            table_input)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        worksheet_name = f"Иерархия_{timestamp}"
-        worksheet = spreadsheet.add_worksheet(title=worksheet_name, rows=1000, cols=7)
-
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            folders = data.get('folders', [])
-            files = natsorted(data.get('files', []), alg=ns.LOCALE)
-            pdf_analysis_data = data.get('pdf_analysis_data', {})
-            logger.info(f"PDF-анализ в json: {list(pdf_analysis_data.keys())}")
-            logger.info(f"Корневые файлы: {files}")
-
-        flat_data, stats = flatten_hierarchy(folders, pdf_analysis_data=pdf_analysis_data)
-
-        if files:
-            flat_data.append(("", 1, "", "", "", "", True, False, False))  # Пустая строка
-        for file in files:
-            file_normalized = os.path.normpath(file).replace('\\', '/')
-            analysis = pdf_analysis_data.get(file_normalized, {})
-            pages = analysis.get('pages', "") if file.lower().endswith('.pdf') else ""
-            size = analysis.get('size', "")
-            orientation = analysis.get('orientation', "")
-            char_count = analysis.get('char_count', "")
-            is_archive = file.lower().endswith(('.rar', '.zip'))
-            logger.info(f"Обработка корневого файла: {file_normalized}, страницы: {pages}, ориентация страницы: {size}, ориентация текста: {orientation}, символы: {char_count}, архив: {is_archive}")
-            flat_data.append((file, 1, pages, size, orientation, char_count, False, False, is_archive))
-            _, ext = os.path.splitext(file.lower())
-            stats['files'][ext or 'no_extension'] += 1
-            stats['max_level'] = max(stats['max_level'], 1)
+        with run_metrics.stage('upload'):
+            spreadsheet_id = open_spreadsheet_id(table_input, api)
+
+        with run_metrics.stage('flatten'):
+            flat_data, stats = flatten_tree(tree)
+        run_metrics.record('flatten', rows=len(flat_data))
 
         logger.info(f"Обнаружено {len(flat_data)} элементов для записи.")
         logger.info(f"Статистика: {stats['folders']} папок, максимальный уровень вложенности: {stats['max_level']}")
         logger.info("Файлы по расширениям: " + ", ".join(f"{ext}: {count}" for ext, count in stats['files'].items()))
 
         # Подготовка данных для таблицы
-        values = []
-        headers = ["Имя", "Уровень", "Кол-во страниц (PDF)", "Ориентация страницы"]
-        values.append(headers)
-
-        for item, level, pages, size, orientation, char_count, is_separator, _, is_archive in flat_data:
-            translation_stats = ""
-            values.append(
-                [f"{'  ' * level}{item}", str(level) if not is_separator else "", str(pages), size, orientation, char_count, translation_stats])
-
-        # Записываем данные
-        worksheet.update(range_name=f'A1:G{len(values)}', values=values, value_input_option="RAW")
-
-        # Форматирование
-        level_ranges = defaultdict(list)
-        archive_ranges = []
-        for idx, (item, level, _, _, _, _, is_separator, is_folder, is_archive) in enumerate(flat_data, start=2):
-            if is_archive:
-                archive_ranges.append(f'A{idx}:G{idx}')
-            elif is_separator or is_folder:
-                level_ranges[level].append(f'A{idx}:G{idx}')
-
-        for level, cells in level_ranges.items():
-            color = get_color_for_level(level)
-            worksheet.format(cells, {
-                "backgroundColor": {"red": color[0], "green": color[1], "blue": color[2]}
-            })
-
-        if archive_ranges:
-            worksheet.format(archive_ranges, {
-                "backgroundColor": {"red": 1.0, "green": 1.0, "blue": 0.0}
-            })
-
-        worksheet.format('A1:G1', {
-            "textFormat": {"bold": True},
-            "backgroundColor": {"red": 0.7, "green": 0.7, "blue": 0.7}
-        })
+        with run_metrics.stage('serialize', rows=len(flat_data)):
+            values = build_values(flat_data)
+
+        upload_start = time.perf_counter()
+        sync_stats = None
+        if sync_worksheet:
+            worksheet_name = sync_worksheet
+            sync_stats = sync_sheet(api, spreadsheet_id, worksheet_name, values, flat_data)
+            if sync_stats is None:
+                logger.info(f"Лист '{worksheet_name}' не найден, он будет создан")
+            else:
+                logger.info(f"Синхронизация листа '{worksheet_name}': вставлено {sync_stats['inserted']}, "
+                            f"удалено {sync_stats['deleted']}, обновлено {sync_stats['updated']} строк")
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            worksheet_name = f"Иерархия_{timestamp}"
+        if sync_stats is None:
+            # Лист точного размера и всё форматирование — одним вызовом batchUpdate
+            write_new_sheet(api, spreadsheet_id, worksheet_name, values, flat_data)
+        run_metrics.record('upload', time.perf_counter() - upload_start, rows=len(values),
+                           api_calls=api.calls, api_retries=api.retries)
 
         elapsed_time = time.time() - start_time
-        logger.info(f"Запись завершена в лист '{worksheet_name}'. Всего строк: {len(values)}. Время выполнения: {elapsed_time:.2f} секунд")
+        logger.info(f"Запись завершена в лист '{worksheet_name}'. Всего строк: {len(values)}. "
+                    f"Вызовов API: {api.calls} (повторов: {api.retries}). Время выполнения: {elapsed_time:.2f} секунд")
 
         summary = {
             "total_items": len(flat_data),
             "folders": stats['folders'],
             "max_level": stats['max_level'],
             "files_by_extension": dict(stats['files']),
-            "pdf_analysis_data": pdf_analysis_data
+            "api_calls": api.calls,
+            "api_retries": api.retries
         }
+        if sync_stats is not None:
+            summary["sync"] = sync_stats
         return f"Иерархия успешно записана в лист '{worksheet_name}'.", summary
 
-    except gspread.SpreadsheetNotFound:
+    except SpreadsheetNotFound:
         elapsed_time = time.time() - start_time
         logger.error(f"Таблица не найдена: {table_input}. Время выполнения: {elapsed_time:.2f} секунд")
         raise Exception(f"Ошибка: Таблица '{table_input}' не найдена")
+    except SheetsApiError as e:
+        elapsed_time = time.time() - start_time
+        logger.error(f"Ошибка: {e}. Время выполнения: {elapsed_time:.2f} секунд")
+        if e.status_code == 404:
+            raise Exception(f"Ошибка: Таблица '{table_input}' не найдена")
+        raise
     except Exception as e:
         elapsed_time = time.time() - start_time
         logger.error(f"Ошибка: {e}. Время выполнения: {elapsed_time:.2f} секунд")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+def serial_listings(list_func, root_task):
+    """Последовательный обход: list_func(задача) -> (результат, дочерние задачи). Отдаёт результаты."""
+    stack = deque([root_task])
+    while stack:
+        result, children = list_func(stack.pop())
+        yield result
+        stack.extend(children)
+
+
+class WorkStealingLister:
+    """
+    Пул потоков для параллельного чтения каталогов с кражей работы.
+
+    У каждого потока своя дека задач: найденные подкаталоги он кладёт в свою деку и берёт
+    следующими с конца (обход в глубину), а простаивающий поток крадёт задачу с начала деки
+    соседа — там лежат поддеревья ближе к корню, то есть самые крупные куски работы.
+    Одновременно выполняется не более max_in_flight вызовов list_func (чтений каталогов),
+    чтобы не перегружать файловый сервер.
+
+    Результат задачи попадает в очередь раньше, чем её дочерние задачи становятся доступны
+    другим потокам, поэтому потребитель всегда получает каталог раньше его подкаталогов.
+    """
+
+    def __init__(self, list_func, workers, max_in_flight=None):
+        self.list_func = list_func
+        self.workers = workers
+        self.max_in_flight = max_in_flight or workers
+        self.steals = 0
+        self._deques = [deque() for _ in range(workers)]
+        self._condition = threading.Condition()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._results = queue.Queue()
+        self._pending = 0
+        self._stopped = False
+
+    def run(self, root_task):
+        """Генератор результатов list_func в порядке завершения; при закрытии генератора потоки останавливаются."""
+        self._deques[0].append(root_task)
+        self._pending = 1
+        threads = [threading.Thread(target=self._worker, args=(index,), name=f'scan-{index}', daemon=True)
+                   for index in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self._results.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            with self._condition:
+                self._stopped = True
+                self._condition.notify_all()
+            for thread in threads:
+                thread.join()
+            logger.info(f"Параллельный обход: {self.workers} потоков, украдено задач: {self.steals}")
+
+    def _take(self, index):
+        own = self._deques[index]
+        if own:
+            return own.pop()
+        for offset in range(1, self.workers):
+            victim = self._deques[(index + offset) % self.workers]
+            if victim:
+                self.steals += 1
+                return victim.popleft()
+        return None
+
+    def _worker(self, index):
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopped or self._pending == 0:
+                        return
+                    task = self._take(index)
+                    if task is not None:
+                        break
+                    self._condition.wait()
+            try:
+                with self._in_flight:
+                    result, children = self.list_func(task)
+            except Exception as e:
+                with self._condition:
+                    self._stopped = True
+                    self._results.put(e)
+                    self._condition.notify_all()
+                return
+            with self._condition:
+                self._deques[index].extend(children)
+                self._pending += len(children) - 1
+                self._results.put(result)
+                if self._pending == 0:
+                    self._results.put(_DONE)
+                self._condition.notify_all()
@@ -0,0 +1,122 @@
+from array import array
+from collections import deque
+
+ARCHIVE_EXTENSIONS = ('.rar', '.zip')
+
+# Типы узлов
+FOLDER = 0
+FILE = 1
+ARCHIVE = 2
+
+# Значение pages для узлов без числа страниц
+NO_PAGES = -1
+
+
+def file_kind(name):
+    """Тип узла для файла: архивы (RAR/ZIP) разворачиваются в иерархии, остальные — обычные файлы."""
+    return ARCHIVE if name.lower().endswith(ARCHIVE_EXTENSIONS) else FILE
+
+
+class NodeTable:
+    """
+    Компактное дерево инвентаризации: узел — индекс в параллельных массивах.
+
+    Для каждого узла хранятся индекс родителя, номер имени в общем пуле строк (одинаковые
+    имена хранятся один раз), тип, диапазон детей и метрики анализа (число страниц
+    и номер строки формата в том же пуле). Дети узла добавляются одним вызовом
+    add_children и занимают непрерывный диапазон индексов [first_child, first_child + child_count)
+    в заданном порядке: сначала папки, затем файлы. Узел 0 — корневая папка.
+    """
+
+    __slots__ = ('names', '_name_ids', 'parent', 'name_id', 'kind', 'first_child', 'child_count',
+                 'pages', 'format_id')
+
+    def __init__(self, root_name=""):
+        self.names = []
+        self._name_ids = {}
+        self.parent = array('i')
+        self.name_id = array('i')
+        self.kind = array('b')
+        self.first_child = array('i')
+        self.child_count = array('i')
+        self.pages = array('i')
+        self.format_id = array('i')
+        # Строка 0 пула — пустая: ею заполняется формат неанализированных файлов
+        self.intern("")
+        self._append(-1, root_name, FOLDER)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def intern(self, text):
+        """Номер строки в пуле имён (строка добавляется при первом обращении)."""
+        text_id = self._name_ids.get(text)
+        if text_id is None:
+            text_id = self._name_ids[text] = len(self.names)
+            self.names.append(text)
+        return text_id
+
+    def _append(self, parent, name, kind):
+        self.parent.append(parent)
+        self.name_id.append(self.intern(name))
+        self.kind.append(kind)
+        self.first_child.append(0)
+        self.child_count.append(0)
+        self.pages.append(NO_PAGES)
+        self.format_id.append(0)
+
+    def add_children(self, node, children):
+        """
+        Добавляет детей узла. children — список (имя, тип) в порядке вывода: папки, затем файлы.
+        Возвращает индекс первого ребёнка; дети узла добавляются только один раз.
+        """
+        if self.child_count[node]:
+            raise ValueError(f"Дети узла {node} уже добавлены")
+        first = len(self.parent)
+        for name, kind in children:
+            self._append(node, name, kind)
+        self.first_child[node] = first
+        self.child_count[node] = len(children)
+        return first
+
+    def children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.child_count[node])
+
+    def name(self, node):
+        return self.names[self.name_id[node]]
+
+    def set_metrics(self, node, metrics):
+        """Сохраняет метрики анализа {"pages", "size"} для узла."""
+        pages = metrics.get("pages")
+        self.pages[node] = pages if isinstance(pages, int) else NO_PAGES
+        self.format_id[node] = self.intern(metrics.get("size") or "")
+
+    def metrics(self, node):
+        """Метрики узла в виде {"pages", "size"}; пустые строки для неанализированных файлов."""
+        pages = self.pages[node]
+        return {"pages": pages if pages != NO_PAGES else "", "size": self.names[self.format_id[node]]}
+
+    def add_structure(self, node, structure, analysis=None):
+        """
+        Подвешивает к узлу вложенную структуру [{папка: [...]}, "файл", ...] (листинг архива).
+        analysis — {путь внутри структуры: метрики}; пути собираются только при этом разборе.
+        """
+        analysis = analysis or {}
+        queue = deque([(node, structure, "")])
+        while queue:
+            parent, items, prefix = queue.popleft()
+            children = []
+            for item in items:
+                if isinstance(item, dict):
+                    children.append((next(iter(item)), FOLDER))
+                else:
+                    children.append((item, file_kind(item)))
+            first = self.add_children(parent, children)
+            for offset, item in enumerate(items):
+                child = first + offset
+                if isinstance(item, dict):
+                    folder_name, content = next(iter(item.items()))
+                    queue.append((child, content, f"{prefix}{folder_name}/"))
+                elif f"{prefix}{item}" in analysis:
+                    self.set_metrics(child, analysis[f"{prefix}{item}"])